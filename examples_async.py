@@ -1,11 +1,16 @@
 import asyncio
+import json
+import time
+from base64 import b64encode
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List
 
-from aiohttp import ClientSession
+from aiohttp import ClientSession, WSMessage, WSMsgType
 
 from ichrome import AsyncChromeDaemon, ChromeEngine
 from ichrome.async_utils import AsyncChrome, AsyncTab, Tag, logger
+from ichrome.exceptions import ChromeRuntimeError, ChromeValueError
 
 # logger.setLevel('DEBUG')
 # AsyncTab._log_all_recv = True
@@ -480,6 +485,317 @@ async def test_tab_new_tab(chromed: AsyncChromeDaemon):
         assert not tab_exist
 
 
+class _FakeWebSocket:
+    "the ws of a fake page: reply the sent commands with `reply(request)`, and receive the frames pushed by `push`"
+
+    def __init__(self, reply=None):
+        self.reply = reply
+        self.closed = False
+        self.sent: List[dict] = []
+        self._frames: asyncio.Queue = asyncio.Queue()
+
+    def push(self, frame):
+        if not isinstance(frame, str):
+            # compact JSON like chrome
+            frame = json.dumps(frame, separators=(",", ":"))
+        self._frames.put_nowait(frame)
+
+    async def send_str(self, data):
+        request = json.loads(data)
+        self.sent.append(request)
+        if self.reply:
+            response = self.reply(request)
+        else:
+            response = {"id": request["id"], "result": {}}
+        if response is not None:
+            self.push(response)
+
+    async def close(self):
+        self.closed = True
+        self._frames.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await self._frames.get()
+        if frame is None:
+            raise StopAsyncIteration
+        return WSMessage(WSMsgType.TEXT, frame, None)
+
+
+@asynccontextmanager
+async def offline_tab(reply=None):
+    "AsyncTab connected to the _FakeWebSocket, no chrome needed"
+    tab = AsyncTab(
+        tab_id="offline",
+        webSocketDebuggerUrl="ws://127.0.0.1:9222/devtools/page/offline",
+        flatten=False,
+    )
+    tab.ws = _FakeWebSocket(reply)
+    recv_task = asyncio.create_task(tab._recv_daemon())
+    try:
+        yield tab
+    finally:
+        await tab.ws.close()
+        await recv_task
+        await tab.req.close()
+
+
+async def test_recv_prefilter():
+    # (method, sessionId) is peeked only while the sessionId is the last key
+    assert AsyncTab._peek_event(
+        '{"method":"Network.dataReceived","params":{"requestId":"1"}}'
+    ) == ("Network.dataReceived", None)
+    assert AsyncTab._peek_event(
+        '{"method":"Network.dataReceived","params":{"requestId":"1"},"sessionId":"S1"}'
+    ) == ("Network.dataReceived", "S1")
+    # sessionId is not the last key, or nested in the params
+    assert (
+        AsyncTab._peek_event(
+            '{"method":"Page.loadEventFired","sessionId":"S1","params":{"timestamp":1}}'
+        )
+        is None
+    )
+    assert (
+        AsyncTab._peek_event(
+            '{"method":"Target.attachedToTarget","params":{"sessionId":"S1","targetInfo":{}}}'
+        )
+        is None
+    )
+    assert (
+        AsyncTab._peek_event(
+            '{"method":"Target.attachedToTarget","params":{"targetInfo":{},"sessionId":"S1"}}'
+        )
+        is None
+    )
+    assert AsyncTab._peek_event('{"id":1,"result":{}}') is None
+    async with offline_tab() as tab:
+        task = asyncio.create_task(
+            tab.recv({"method": "Page.loadEventFired", "sessionId": "S1"}, timeout=2)
+        )
+        await asyncio.sleep(0.1)
+        decoded = tab.recv_stats["decoded"]
+        # nobody wants them
+        tab.ws.push('{"method":"Network.dataReceived","params":{"requestId":"1"}}')
+        tab.ws.push(
+            '{"method":"Page.loadEventFired","params":{"timestamp":1},"sessionId":"S2"}'
+        )
+        # can not be peeked, decoded
+        tab.ws.push(
+            '{"method":"Target.attachedToTarget","params":{"sessionId":"S1","targetInfo":{}}}'
+        )
+        tab.ws.push(
+            '{"method":"Page.loadEventFired","sessionId":"S1","params":{"timestamp":2}}'
+        )
+        result = await task
+        assert result["params"]["timestamp"] == 2, result
+        stats = tab.recv_stats
+        assert stats["skipped"] == 2, stats
+        assert stats["decoded"] == decoded + 2, stats
+        # the events without session are wanted by the default_recv_callback
+        received = []
+        tab.default_recv_callback = lambda tab, data: received.append(data)
+        tab.ws.push('{"method":"Network.dataReceived","params":{"requestId":"2"}}')
+        await asyncio.sleep(0.1)
+        assert received and received[0]["params"]["requestId"] == "2", received
+        assert tab.recv_stats["skipped"] == 2
+
+
+async def test_listener():
+    async with offline_tab() as tab:
+        # duplicated key
+        task = asyncio.create_task(
+            tab.recv({"method": "Page.loadEventFired"}, timeout=2)
+        )
+        await asyncio.sleep(0.1)
+        try:
+            await tab.recv({"method": "Page.loadEventFired"}, timeout=2)
+            raise AssertionError("duplicated key should raise")
+        except ChromeValueError:
+            pass
+        # cancellation unregisters the future
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        assert tab.listener_stats["pending"] == 0, tab.listener_stats
+        # timeout unregisters the future
+        assert await tab.recv({"method": "Page.loadEventFired"}, timeout=0.1) is None
+        assert tab.listener_stats["pending"] == 0, tab.listener_stats
+        # the new future of the same key works
+        task = asyncio.create_task(
+            tab.recv({"method": "Page.loadEventFired"}, timeout=2)
+        )
+        await asyncio.sleep(0.1)
+        tab.ws.push('{"method":"Page.loadEventFired","params":{"timestamp":3}}')
+        assert (await task)["params"]["timestamp"] == 3
+        # send_many unregisters the futures registered before the duplicated one
+        next_id = tab._message_id + 2
+        f = tab._listener.register({"id": next_id}, timeout=2)
+        try:
+            await tab.send_many(
+                ["Page.bringToFront"] * 3, timeout=2, auto_enable=False
+            )
+            raise AssertionError("duplicated key should raise")
+        except ChromeRuntimeError as error:
+            assert "duplicated" in str(error), error
+        assert tab.listener_stats["pending"] == 1, tab.listener_stats
+        assert tab._listener.unregister({"id": next_id}, f)
+        assert tab.listener_stats["pending"] == 0, tab.listener_stats
+
+
+def _reply_send_many(request):
+    if request["method"] == "Test.error":
+        return {"id": request["id"], "error": {"code": -32000, "message": "error"}}
+    elif request["method"] == "Test.noResponse":
+        return None
+    return {"id": request["id"], "result": {"method": request["method"]}}
+
+
+async def test_send_many():
+    async with offline_tab(_reply_send_many) as tab:
+        # collect the responses in order, the error response / None for timeout
+        results = await tab.send_many(
+            ["Test.ok", ("Test.error", {"a": 1}), "Test.noResponse"],
+            timeout=0.3,
+            auto_enable=False,
+        )
+        assert results[0]["result"] == {"method": "Test.ok"}, results
+        assert "error" in results[1], results
+        assert results[2] is None, results
+        assert tab.listener_stats["pending"] == 0, tab.listener_stats
+        # fail_fast raises for the error response without waiting for the others
+        start = time.time()
+        try:
+            await tab.send_many(
+                ["Test.noResponse", "Test.error"],
+                timeout=2,
+                auto_enable=False,
+                fail_fast=True,
+            )
+            raise AssertionError("fail_fast should raise")
+        except ChromeRuntimeError as error:
+            assert "error response" in str(error), error
+        assert time.time() - start < 1
+        assert tab.listener_stats["pending"] == 0, tab.listener_stats
+        # fail_fast raises for the timeout
+        try:
+            await tab.send_many(
+                ["Test.ok", "Test.noResponse"],
+                timeout=0.2,
+                auto_enable=False,
+                fail_fast=True,
+            )
+            raise AssertionError("fail_fast should raise")
+        except ChromeRuntimeError as error:
+            assert "timeout" in str(error), error
+        assert tab.listener_stats["pending"] == 0, tab.listener_stats
+        # no wait
+        assert await tab.send_many(
+            ["Test.ok", "Test.ok"], timeout=0, auto_enable=False
+        ) == [None, None]
+
+
+async def test_event_buffer_overflow():
+    def push_events(tab, amount):
+        for index in range(amount):
+            tab.ws.push(
+                '{"method":"Network.dataReceived","params":{"index":%s}}' % index
+            )
+
+    async with offline_tab() as tab:
+        # drop_newest by default, and the reader is never blocked
+        async with tab.iter_events(["Network.dataReceived"], maxsize=2) as buffer:
+            push_events(tab, 5)
+            assert await tab.send("Page.bringToFront", timeout=2, auto_enable=False)
+            assert buffer.stats["overflow"] == "drop_newest", buffer.stats
+            assert [buffer.get_nowait()["params"]["index"] for _ in range(2)] == [0, 1]
+            assert buffer.stats["dropped"] == 3, buffer.stats
+            assert buffer.stats["high_water_mark"] == 2, buffer.stats
+        async with tab.iter_events(
+            ["Network.dataReceived"], maxsize=2, overflow="drop_oldest"
+        ) as buffer:
+            push_events(tab, 5)
+            assert await tab.send("Page.bringToFront", timeout=2, auto_enable=False)
+            assert [buffer.get_nowait()["params"]["index"] for _ in range(2)] == [3, 4]
+        async with tab.iter_events(
+            ["Network.dataReceived"], overflow="sample", sample_every=2
+        ) as buffer:
+            push_events(tab, 5)
+            assert await tab.send("Page.bringToFront", timeout=2, auto_enable=False)
+            assert [buffer.get_nowait()["params"]["index"] for _ in range(2)] == [1, 3]
+            assert buffer.empty()
+        # block: keep all the events, the reader waits for the consumer
+        async with tab.iter_events(
+            ["Network.dataReceived"], maxsize=1, overflow="block"
+        ) as buffer:
+            push_events(tab, 3)
+            await asyncio.sleep(0.1)
+            assert buffer.stats["blocked"] is True, buffer.stats
+            indexes = [(await buffer.get())["params"]["index"] for _ in range(3)]
+            assert indexes == [0, 1, 2], indexes
+            assert buffer.stats["dropped"] == 0, buffer.stats
+        # the consumer of FetchBuffer sends the responses over the same ws
+        try:
+            tab.iter_fetch(overflow="block")
+            raise AssertionError("FetchBuffer should not block")
+        except ChromeValueError:
+            pass
+
+
+def _reply_raw(request):
+    if request["method"] == "Page.captureScreenshot":
+        if request["params"].get("format") == "error":
+            return {"id": request["id"], "error": {"code": -32000, "message": "error"}}
+        data = b64encode(bytes(range(256)) * 3).decode()
+        return {"id": request["id"], "result": {"data": data}}
+    return {"id": request["id"], "result": {}}
+
+
+async def test_raw_decode():
+    chunk_size = AsyncTab._RAW_DECODE_CHUNK_SIZE
+    # decode the payload chunk by chunk
+    AsyncTab._RAW_DECODE_CHUNK_SIZE = 64
+    try:
+        async with offline_tab(_reply_raw) as tab:
+            result = await tab.send("Page.captureScreenshot", timeout=2, raw=True)
+            data = result["result"]["data"]
+            assert isinstance(data, bytes) and data == bytes(range(256)) * 3
+            assert not tab._listener.raw_fields
+            # not raw
+            result = await tab.send("Page.captureScreenshot", timeout=2)
+            assert isinstance(result["result"]["data"], str)
+            # error response
+            result = await tab.send(
+                "Page.captureScreenshot", timeout=2, raw=True, format="error"
+            )
+            assert "error" in result, result
+            assert not tab._listener.raw_fields
+            try:
+                await tab.send("Page.navigate", timeout=2, raw=True)
+                raise AssertionError("raw mode should only support _RAW_RESULT_FIELDS")
+            except ChromeValueError:
+                pass
+    finally:
+        AsyncTab._RAW_DECODE_CHUNK_SIZE = chunk_size
+
+
+async def test_offline():
+    "the hot paths of the recv daemon, no chrome needed"
+    await test_recv_prefilter()
+    logger.info("test_recv_prefilter OK.")
+    await test_listener()
+    logger.info("test_listener OK.")
+    await test_send_many()
+    logger.info("test_send_many OK.")
+    await test_event_buffer_overflow()
+    logger.info("test_event_buffer_overflow OK.")
+    await test_raw_decode()
+    logger.info("test_raw_decode OK.")
+
+
 async def test_examples():
     def on_startup(chromed):
         chromed.started = 1
@@ -664,6 +980,7 @@ def test_all():
     AsyncChromeDaemon.DEFAULT_USER_DIR_PATH = Path("./ichrome_user_data")
     loop = asyncio.new_event_loop()
     try:
+        loop.run_until_complete(test_offline())
         for flatten in [True, False, True]:
             logger.critical("Start testing flatten=%s." % flatten)
             AsyncTab._DEFAULT_FLATTEN = flatten
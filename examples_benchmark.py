@@ -0,0 +1,187 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ichrome import AsyncChromeDaemon
+from ichrome.async_utils import AsyncTab
+from ichrome.base import JSONCodec
+from ichrome.pool import ChromeEngine
+
+# python examples_benchmark.py
+# messages/sec of the AsyncTab._recv_daemon hot path, with different JSON codecs.
+# max event loop lag while receiving the oversized frames.
+# tasks/sec of ChromeEngine with a new tab per task vs the recycled tabs, skip if chrome not found.
+
+SAMPLE_FRAMES = [
+    '{"method":"Network.dataReceived","params":{"requestId":"1000.%s","timestamp":120277.621681,"dataLength":8192,"encodedDataLength":0},"sessionId":"9B732FA5900F6CE37B7B647D99B74897"}',
+    '{"method":"Network.responseReceived","params":{"requestId":"1000.%s","loaderId":"F4BD3CBE619185B514F0F42B0CBCCFA1","timestamp":120277.6,"type":"Script","response":{"url":"https://example.com/static/app.js","status":200,"statusText":"OK","headers":{"content-type":"application/javascript","content-length":"123456","cache-control":"max-age=3600"},"mimeType":"application/javascript","connectionReused":true,"connectionId":42,"encodedDataLength":300,"securityState":"secure"},"frameId":"7F34509F1831E6F29351784861615D1C"},"sessionId":"9B732FA5900F6CE37B7B647D99B74897"}',
+    '{"id":%s,"result":{"result":{"type":"string","value":"http://p.3.cn/"}},"sessionId":"9B732FA5900F6CE37B7B647D99B74897"}',
+]
+
+
+class _Message:
+    __slots__ = ("type", "data")
+
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+
+
+class _FakeWebSocket:
+    "replay the frames like aiohttp ClientWebSocketResponse"
+
+    def __init__(self, frames, network_delay=False):
+        self.frames = frames
+        self.closed = False
+        self.sent = 0
+        # switch to the loop for each frame, like the real network
+        self.network_delay = network_delay
+
+    async def send_str(self, data):
+        self.sent += 1
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        from aiohttp.http import WSMsgType
+
+        for frame in self.frames:
+            if self.network_delay:
+                await asyncio.sleep(0)
+            yield _Message(WSMsgType.TEXT, frame)
+
+
+def get_frames(count):
+    return [SAMPLE_FRAMES[i % len(SAMPLE_FRAMES)] % i for i in range(count)]
+
+
+async def bench_codec(codec: JSONCodec, count=100000):
+    tab = AsyncTab(
+        tab_id="browser",
+        type="browser",
+        webSocketDebuggerUrl="ws://127.0.0.1:9222/devtools/browser/benchmark",
+        flatten=False,
+        codec=codec,
+    )
+    try:
+        # recv
+        tab.ws = _FakeWebSocket(get_frames(count))
+        start = time.perf_counter()
+        await tab._recv_daemon()
+        recv_cost = time.perf_counter() - start
+        # send
+        start = time.perf_counter()
+        for _ in range(count):
+            await tab.send(
+                "Runtime.evaluate",
+                timeout=0,
+                auto_enable=False,
+                expression="document.title",
+            )
+        send_cost = time.perf_counter() - start
+    finally:
+        await tab.req.close()
+    print(
+        f"{codec!r:<20} recv: {count / recv_cost:>10.0f} msg/s, send: {count / send_cost:>10.0f} msg/s, prefilter={tab._PREFILTER_EVENTS} {tab.recv_stats}",
+        flush=True,
+    )
+
+
+def get_large_frames(count, size=15 * 1024**2):
+    "a 15MB screenshot response, mixed with small frames"
+    large = '{"id":0,"result":{"data":"%s"},"sessionId":"9B732FA5900F6CE37B7B647D99B74897"}' % (
+        "A" * size
+    )
+    frames = get_frames(count)
+    for index in range(0, count, count // 5):
+        frames[index] = large
+    return frames
+
+
+async def bench_loop_lag(offload_size, executor=None, count=5000):
+    AsyncTab._OFFLOAD_DECODE_SIZE = offload_size
+    AsyncTab._OFFLOAD_DECODE_EXECUTOR = executor
+    tab = AsyncTab(
+        tab_id="browser",
+        type="browser",
+        webSocketDebuggerUrl="ws://127.0.0.1:9222/devtools/browser/benchmark",
+        flatten=False,
+    )
+    lags = []
+
+    async def ticker():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    try:
+        tab.ws = _FakeWebSocket(get_large_frames(count), network_delay=True)
+        task = asyncio.ensure_future(ticker())
+        start = time.perf_counter()
+        await tab._recv_daemon()
+        cost = time.perf_counter() - start
+        task.cancel()
+    finally:
+        await tab.req.close()
+    print(
+        f"offload_size={offload_size:<8} executor={executor.__class__.__name__ if executor else None!s:<20} cost: {cost:.3f}s, max loop lag: {max(lags) * 1000:.1f}ms {tab.recv_stats}",
+        flush=True,
+    )
+
+
+async def _recycle_callback(task, tab, data, timeout):
+    await tab.set_url(data, timeout=timeout)
+    return await tab.get_variable("document.title", timeout=timeout)
+
+
+async def bench_tab_recycle(recycle_tabs, count=100, concurrency=5):
+    url = "data:text/html,<title>benchmark</title>"
+    async with ChromeEngine(
+        max_concurrent_tabs=concurrency,
+        recycle_tabs=recycle_tabs,
+        headless=True,
+        after_shutdown=lambda cd: cd.clear_dir_with_shutil(cd.user_data_dir),
+    ) as ce:
+        # warm up the chrome process
+        await ce.do(url, _recycle_callback, timeout=10)
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[ce.do(url, _recycle_callback, timeout=10) for _ in range(count)]
+        )
+        cost = time.perf_counter() - start
+    ok = sum((result == "benchmark" for result in results))
+    print(
+        f"recycle_tabs={recycle_tabs:<3} {count / cost:>8.1f} tasks/s, ok: {ok}/{count}",
+        flush=True,
+    )
+
+
+async def main():
+    await bench_loop_lag(0)
+    await bench_loop_lag(1024**2)
+    with ProcessPoolExecutor(1) as executor:
+        # start the worker process before the benchmark
+        await asyncio.get_running_loop().run_in_executor(executor, int)
+        await bench_loop_lag(1024**2, executor)
+    AsyncTab._OFFLOAD_DECODE_SIZE = 0
+    AsyncTab._OFFLOAD_DECODE_EXECUTOR = None
+    for prefilter in (False, True):
+        AsyncTab._PREFILTER_EVENTS = prefilter
+        for backend in JSONCodec.BACKENDS:
+            try:
+                codec = JSONCodec(backend)
+            except ImportError:
+                print(f"{backend} is not installed, skip.", flush=True)
+                continue
+            await bench_codec(codec)
+    if AsyncChromeDaemon.get_chrome_path():
+        for recycle_tabs in (0, 5):
+            await bench_tab_recycle(recycle_tabs)
+    else:
+        print("chrome is not found, skip the tab recycle benchmark.", flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -208,6 +208,11 @@ Other operations:
         default=1,
         type=int,
     )
+    parser.add_argument(
+        "--manifest",
+        help="write the JSON manifest of the running chrome workers to this path, for AsyncChrome.from_manifest",
+        default=None,
+    )
     parser.add_argument(
         "--proc-check-interval",
         "--proc_check_interval",
@@ -303,7 +308,12 @@ Other operations:
         kwargs = json.loads(path.read_text())
         start_port = kwargs.pop("port", 9222)
         workers = kwargs.pop("workers", 1)
-        asyncio.run(ChromeWorkers.run_chrome_workers(start_port, workers, kwargs))
+        manifest_path = kwargs.pop("manifest", None) or args.manifest
+        asyncio.run(
+            ChromeWorkers.run_chrome_workers(
+                start_port, workers, kwargs, manifest_path=manifest_path
+            )
+        )
         return
     if args.shutdown:
         logger.setLevel(1)
@@ -391,7 +401,9 @@ Other operations:
             return
         else:
             asyncio.run(
-                ChromeWorkers.run_chrome_workers(start_port, args.workers, kwargs)
+                ChromeWorkers.run_chrome_workers(
+                    start_port, args.workers, kwargs, manifest_path=args.manifest
+                )
             )
 
 
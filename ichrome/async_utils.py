@@ -2,17 +2,19 @@
 # fast and stable connection
 import asyncio
 import inspect
-import json
 import re
 import sys
 import time
 from asyncio.base_futures import _PENDING
 from asyncio.futures import Future
 from base64 import b64decode, b64encode
+from binascii import a2b_base64
+from concurrent.futures import Executor
 from fnmatch import fnmatchcase
 from pathlib import Path
 from typing import (
     Any,
+    AsyncIterator,
     Awaitable,
     Callable,
     Coroutine,
@@ -21,9 +23,10 @@ from typing import (
     Literal,
     Optional,
     Set,
+    Tuple,
     Union,
 )
-from urllib.parse import quote_plus, urljoin
+from urllib.parse import quote_plus, urljoin, urlparse
 from weakref import WeakValueDictionary
 
 from aiohttp import ClientResponse, ClientSession
@@ -33,6 +36,7 @@ from aiohttp.http import WebSocketError, WSMsgType
 
 from .base import (
     INF,
+    JSONCodec,
     NotSet,
     Tag,
     TagNotFound,
@@ -40,6 +44,7 @@ from .base import (
     clear_chrome_process,
     ensure_awaitable,
     get_memory_by_port,
+    to_thread,
 )
 from .exceptions import (
     ChromeProcessMissingError,
@@ -49,6 +54,7 @@ from .exceptions import (
     TabConnectionError,
 )
 from .logs import logger
+from .utils import PipeWebSocket
 
 
 async def _ensure_awaitable_callback_result(callback_function, result):
@@ -166,7 +172,7 @@ class _WSConnection:
 
     @property
     def browser(self):
-        return self.tab.chrome.browser
+        return self.tab.browser
 
     async def __aenter__(self) -> "AsyncTab":
         return await self.connect()
@@ -174,11 +180,16 @@ class _WSConnection:
     async def connect(self) -> "AsyncTab":
         """Connect to websocket, and set tab.ws as aiohttp.client_ws.ClientWebSocketResponse."""
         if self.tab.flatten:
+            # spread the sessions across the browser shards
+            self.tab._bind_browser(self.tab.chrome.pick_browser())
             data = await self.browser.send(
                 "Target.attachToTarget", targetId=self.tab.tab_id, flatten=True
             )
             self.tab._session_id = data["result"]["sessionId"]
             self.browser._sessions[self.tab._session_id] = self.tab
+        elif isinstance(self.tab.ws, PipeWebSocket):
+            # --remote-debugging-pipe mode, the pipe is connected by the daemon
+            await self._start_tasks()
         else:
             for _ in range(3):
                 try:
@@ -216,6 +227,18 @@ class _WSConnection:
             except asyncio.TimeoutError:
                 pass
 
+    async def detach(self):
+        "stop the recv daemon without closing the ws, for the pipe which will be read by the next connection"
+        self._closed = True
+        task = self._recv_task
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.tab.ws = None
+
     async def shutdown(self):
         if self._closed:
             return
@@ -223,17 +246,18 @@ class _WSConnection:
         try:
             if self.tab.flatten:
                 self._closed = True
-                if self.tab._session_id:
+                session_id = self.tab._session_id
+                if session_id:
                     self.tab._session_id = None
                     try:
                         await self.browser.send(
-                            "Target.detachFromTarget", sessionId=self.tab._session_id
+                            "Target.detachFromTarget", sessionId=session_id
                         )
                     except ChromeRuntimeError as error:
                         if "ws has been closed" not in str(error):
                             raise error
                     finally:
-                        self.browser._sessions.pop(self.tab._session_id, None)
+                        self.browser._sessions.pop(session_id, None)
             else:
                 await self._stop_tasks()
                 if self.tab.ws:
@@ -339,8 +363,42 @@ class AsyncTab(GetValueMixin):
     _RECV_DAEMON_BREAK_CALLBACK = None
     # default max_msg_size has been set to 20MB, for 4MB is too small.
     _DEFAULT_WS_KWARGS: Dict = {"max_msg_size": 20 * 1024**2}
+    # chunk size of IO.read for the stream mode payloads
+    _DEFAULT_STREAM_CHUNK_SIZE = 1024**2
     # default flatten arg
     _DEFAULT_FLATTEN = True
+    # JSON codec for send / recv, use the fastest installed backend by default
+    _DEFAULT_CODEC = JSONCodec()
+    # skip decoding the events which no Listener / EventBuffer / callback is waiting for
+    _PREFILTER_EVENTS = True
+    # events should always be decoded, even no one is waiting for them
+    _ALWAYS_DECODE_EVENTS = {"Inspector.detached"}
+    # decode the frames larger than this size off the loop. 0 for never (default).
+    # measured with examples_benchmark.bench_loop_lag (5 frames of 15MB, orjson), max loop lag:
+    #   inline 25-35ms, async_run threads 29-34ms, ProcessPoolExecutor 25-34ms and 4x slower,
+    # the json parsers hold the GIL and the result is unpickled in the loop process, so it is opt-in.
+    _OFFLOAD_DECODE_SIZE = 0
+    # executor for the oversized frames, None for the async_run threads.
+    _OFFLOAD_DECODE_EXECUTOR: Optional[Executor] = None
+    # {method: field}, the base64 field of the result which can be decoded as bytes in the raw mode
+    _RAW_RESULT_FIELDS: Dict[str, str] = {
+        "Page.captureScreenshot": "data",
+        "Page.printToPDF": "data",
+        "Network.getResponseBody": "body",
+        "Fetch.getResponseBody": "body",
+        "IO.read": "data",
+    }
+    # base64 chars decoded each time for the raw mode, should be a multiple of 4
+    _RAW_DECODE_CHUNK_SIZE = 1024**2
+    # the overrides sent by this tab, restored by reset_state
+    _RESET_STATE_METHODS = {
+        "Network.setExtraHTTPHeaders": ("Network.setExtraHTTPHeaders", {"headers": {}}),
+        "Network.setUserAgentOverride": ("Network.setUserAgentOverride", {"userAgent": ""}),
+        "Emulation.setUserAgentOverride": (
+            "Emulation.setUserAgentOverride",
+            {"userAgent": ""},
+        ),
+    }
     # EXPERIMENTAL methods
     BACKWARD_COMPATIBLES: Dict[str, Union[bool, None]] = {"Target.getTargetInfo": None}
 
@@ -360,6 +418,7 @@ class AsyncTab(GetValueMixin):
         default_recv_callback: Callable = None,
         _recv_daemon_break_callback: Callable = None,
         flatten: bool = None,
+        codec: JSONCodec = None,
         **kwargs,
     ):
         """Init AsyncTab instance.
@@ -391,6 +450,7 @@ class AsyncTab(GetValueMixin):
             default_recv_callback (Callable, optional): called for each data received, sync/async function only accept 1 arg of data comes from ws recv. Defaults to None.
             _recv_daemon_break_callback (Callable, optional): like the tab_close_callback. sync/async function only accept 1 arg of self while _recv_daemon break. defaults to None.
             flatten (bool, optional): use flatten mode with sessionId. Defaults to AsyncTab._DEFAULT_FLATTEN.
+            codec (JSONCodec, optional): JSON codec for the ws messages. Defaults to chrome.codec or AsyncTab._DEFAULT_CODEC.
 
         """
 
@@ -411,6 +471,9 @@ class AsyncTab(GetValueMixin):
         self.webSocketDebuggerUrl: str = webSocketDebuggerUrl
         self.json = json
         self.chrome = chrome
+        self.codec: JSONCodec = (
+            codec or getattr(chrome, "codec", None) or self._DEFAULT_CODEC
+        )
         self.timeout = self._DEFAULT_RECV_TIMEOUT if timeout is NotSet else timeout
         self.ws_kwargs: dict = ws_kwargs or self._DEFAULT_WS_KWARGS
         self.ws_kwargs.setdefault("timeout", self._DEFAULT_CONNECT_TIMEOUT)
@@ -421,6 +484,7 @@ class AsyncTab(GetValueMixin):
         else:
             self.req = ClientSession()
         # using default_recv_callback.setter, default_recv_callback can be list or function
+        self._default_recv_callback: List[Callable] = []
         self.default_recv_callback = default_recv_callback
         # alias of methods
         self.mouse_click_tag = self.mouse_click_element_rect
@@ -434,16 +498,29 @@ class AsyncTab(GetValueMixin):
             _recv_daemon_break_callback or self._RECV_DAEMON_BREAK_CALLBACK
         )
         self._closed = False
-        self._listener = Listener()
+        self._listener = Listener(codec=self.codec)
         self._buffers: WeakValueDictionary = WeakValueDictionary()
         self._enabled_domains: Set[str] = set()
-        self._default_recv_callback: List[Callable] = []
         self._sessions: WeakValueDictionary = WeakValueDictionary()
         self._session_id: str = None
+        # the browser connection of flatten mode, one of the AsyncChrome shards
+        self._browser_shard: Optional["AsyncTab"] = None
+        # counters of _recv_daemon
+        self._recv_frames_decoded = 0
+        self._recv_frames_skipped = 0
+        self._recv_frames_offloaded = 0
+        # browser connection only, the targets fed by the Target.target* events
+        self._target_registry: Optional[TargetRegistry] = None
+        # the state to be reset by reset_state, for the recycled tabs
+        self._js_onload_ids: Set[str] = set()
+        self._touched_origins: Set[str] = set()
+        self._overridden_methods: Set[str] = set()
         # init after connected
         self._target_info: dict = None
-        # sessions for flatten mode
-        self.flatten: bool = self._DEFAULT_FLATTEN if flatten is None else flatten
+        # sessions for flatten mode, the only choice for the pipe mode
+        if flatten is None:
+            flatten = self._DEFAULT_FLATTEN or bool(getattr(chrome, "pipe", None))
+        self.flatten: bool = flatten
         if self.flatten:
             self.set_flatten()
 
@@ -633,17 +710,23 @@ class AsyncTab(GetValueMixin):
         kwargs: Dict[str, Any] = None,
         auto_enable=True,
         force=None,
+        raw=False,
         **_kwargs,
     ) -> Union[None, dict]:
         """Send message to Tab. callback_function only work whlie timeout!=0.
         If timeout is not None: wait for recv event.
         If auto_enable: will check the domain enabled automatically.
         If callback_function: run while received the response msg.
+        If raw: the base64 field of the result will be decoded as bytes, without decoding it as str. Only for the methods in AsyncTab._RAW_RESULT_FIELDS.
 
         the `force` arg is deprecated, use auto_enable instead.
         """
         self.is_alive()
         timeout = self.ensure_timeout(timeout)
+        if raw and method not in self._RAW_RESULT_FIELDS:
+            raise ChromeValueError(
+                f"raw mode only support {list(self._RAW_RESULT_FIELDS)}, not {method}"
+            )
         if kwargs:
             _kwargs.update(kwargs)
         request = {"id": self.msg_id, "method": method, "params": _kwargs}
@@ -651,6 +734,11 @@ class AsyncTab(GetValueMixin):
             if self._session_id not in self.browser._sessions:
                 raise RuntimeError(f"missing _session_id {self._session_id}")
             request["sessionId"] = self._session_id
+        raw = raw and timeout != 0
+        if raw:
+            self._listener.raw_fields[request["id"]] = self._RAW_RESULT_FIELDS[method]
+        if method in self._RESET_STATE_METHODS:
+            self._overridden_methods.add(method)
         try:
             if not self.ws or self.ws.closed:
                 raise ChromeRuntimeError(f"[closed] {self} ws has been closed")
@@ -663,15 +751,138 @@ class AsyncTab(GetValueMixin):
                 f = self.recv(
                     event, timeout=timeout, callback_function=callback_function
                 )
-                await self.ws.send_json(request)
+                await self.ws.send_str(self.codec.dumps(request))
                 return await f
             else:
                 # timeout == 0, no need wait for response.
-                return await self.ws.send_json(request)
-        except (ClientError, WebSocketError, TypeError) as err:
+                return await self.ws.send_str(self.codec.dumps(request))
+        except (
+            ClientError,
+            WebSocketError,
+            ConnectionResetError,
+        ) + self.codec.errors as err:
             err_msg = f"{self} [send] msg {request} failed for {err}"
             logger.error(err_msg)
             raise ChromeRuntimeError(err_msg)
+        finally:
+            if raw:
+                self._listener.raw_fields.pop(request["id"], None)
+
+    async def send_many(
+        self,
+        commands: List[Union[str, Tuple[str], Tuple[str, Dict[str, Any]]]],
+        timeout=NotSet,
+        auto_enable=True,
+        fail_fast=False,
+    ) -> List[Union[None, dict]]:
+        """Send the commands back-to-back without waiting for each response, and return the responses in order.
+
+        Args:
+            commands (List[Union[str, Tuple[str], Tuple[str, Dict[str, Any]]]]): list of method or (method, params).
+            timeout (_type_, optional): total timeout for all the responses, 0 for no wait. Defaults to NotSet.
+            auto_enable (bool, optional): enable the domains of the methods before sending. Defaults to True.
+            fail_fast (bool, optional): raise ChromeRuntimeError for the first error response or timeout, else collect the error response / None. Defaults to False.
+
+        Demo::
+
+            results = await tab.send_many(
+                [
+                    ("Network.setUserAgentOverride", {"userAgent": "Custom UA."}),
+                    ("Network.setExtraHTTPHeaders", {"headers": {"a": "1"}}),
+                    "Page.bringToFront",
+                ]
+            )
+        """
+        self.is_alive()
+        timeout = self.ensure_timeout(timeout)
+        requests = []
+        for command in commands:
+            if isinstance(command, str):
+                method, params = command, {}
+            else:
+                method = command[0]
+                params = (command[1] if len(command) > 1 else None) or {}
+            request = {"id": self.msg_id, "method": method, "params": params}
+            if self._session_id:
+                request["sessionId"] = self._session_id
+            if method in self._RESET_STATE_METHODS:
+                self._overridden_methods.add(method)
+            requests.append(request)
+        if not requests:
+            return []
+        if self._session_id and self._session_id not in self.browser._sessions:
+            raise RuntimeError(f"missing _session_id {self._session_id}")
+        events = [
+            {"id": request["id"], "sessionId": self._session_id}
+            if self._session_id
+            else {"id": request["id"]}
+            for request in requests
+        ]
+        futures: List[Future] = []
+        try:
+            if not self.ws or self.ws.closed:
+                raise ChromeRuntimeError(f"[closed] {self} ws has been closed")
+            if auto_enable:
+                for method in dict.fromkeys(request["method"] for request in requests):
+                    await self.auto_enable(method, timeout=timeout)
+            logger.debug(f"[send_many] {self!r} {requests}")
+            if timeout != 0:
+                # register all the futures before sending, the registered ones are unregistered in finally if any failed
+                for event in events:
+                    futures.append(self._listener.register(event, timeout=timeout))
+            for request in requests:
+                await self.ws.send_str(self.codec.dumps(request))
+            if timeout == 0:
+                return [None] * len(requests)
+            return await self._wait_many(futures, timeout, fail_fast)
+        except (
+            ClientError,
+            WebSocketError,
+            ConnectionResetError,
+        ) + self.codec.errors as err:
+            err_msg = f"{self} [send_many] msg {requests} failed for {err}"
+            logger.error(err_msg)
+            raise ChromeRuntimeError(err_msg)
+        finally:
+            for event, f in zip(events, futures):
+                self._listener.unregister(event, f)
+
+    async def _wait_many(
+        self, futures: List[Future], timeout, fail_fast: bool
+    ) -> List[Union[None, dict]]:
+        deadline = time.time() + timeout
+        pending = set()
+        for f in futures:
+            if not f.done():
+                pending.add(f)
+            elif fail_fast:
+                self._check_many_error(f)
+        # fail_fast checks each response as soon as it arrives, not in order
+        return_when = asyncio.FIRST_COMPLETED if fail_fast else asyncio.ALL_COMPLETED
+        while pending:
+            _timeout = deadline - time.time()
+            if _timeout <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=_timeout, return_when=return_when
+            )
+            if not done:
+                break
+            if fail_fast:
+                for f in done:
+                    self._check_many_error(f)
+        if fail_fast and pending:
+            raise ChromeRuntimeError(
+                f"{self} [send_many] timeout({timeout}) for {len(pending)} commands."
+            )
+        return [f.result() if f.done() else None for f in futures]
+
+    def _check_many_error(self, f: Future):
+        result = f.result()
+        if result is None:
+            raise ChromeRuntimeError(f"{self} [send_many] empty response.")
+        elif "error" in result:
+            raise ChromeRuntimeError(f"{self} [send_many] error response: {result}")
 
     async def recv(
         self,
@@ -1161,6 +1372,8 @@ class AsyncTab(GetValueMixin):
         maxsize=0,
         kwargs: Any = None,
         callback: Callable = None,
+        overflow: str = None,
+        sample_every: int = 1,
     ) -> "EventBuffer":
         """Iter events with a async context.
         ::
@@ -1213,6 +1426,8 @@ class AsyncTab(GetValueMixin):
             timeout=timeout,
             kwargs=kwargs,
             callback=callback,
+            overflow=overflow,
+            sample_every=sample_every,
         )
 
     def iter_fetch(
@@ -1224,6 +1439,8 @@ class AsyncTab(GetValueMixin):
         maxsize=0,
         kwargs: Any = None,
         callback: Callable = None,
+        overflow: str = None,
+        sample_every: int = 1,
     ) -> "FetchBuffer":
         """
         Fetch.RequestPattern:
@@ -1356,6 +1573,8 @@ class AsyncTab(GetValueMixin):
             maxsize=maxsize,
             kwargs=kwargs,
             callback=callback,
+            overflow=overflow,
+            sample_every=sample_every,
         )
 
     async def pass_auth_proxy(
@@ -1416,6 +1635,7 @@ class AsyncTab(GetValueMixin):
         request_dict: Union[None, dict, str],
         timeout=NotSet,
         wait_loading: bool = None,
+        raw: bool = False,
     ) -> Union[dict, None]:
         """return Network.getResponseBody raw response.
         return demo:
@@ -1423,7 +1643,8 @@ class AsyncTab(GetValueMixin):
                 {'id': 2, 'result': {'body': 'source code', 'base64Encoded': False}}
 
         some ajax request need to await tab.wait_request_loading(request_dict) for
-        loadingFinished (or sleep some secs) and wait_loading=None will auto check response loaded."""
+        loadingFinished (or sleep some secs) and wait_loading=None will auto check response loaded.
+        raw: the base64 encoded body will be decoded as bytes."""
         request_id = self._ensure_request_id(request_dict)
         result = None
         if request_id is None:
@@ -1431,7 +1652,10 @@ class AsyncTab(GetValueMixin):
         timeout = self.ensure_timeout(timeout)
         if wait_loading is None:
             data = await self.send(
-                "Network.getResponseBody", requestId=request_id, timeout=timeout
+                "Network.getResponseBody",
+                requestId=request_id,
+                timeout=timeout,
+                raw=raw,
             )
             if self.get_data_value(data, "error.code") != -32000:
                 return data
@@ -1439,17 +1663,26 @@ class AsyncTab(GetValueMixin):
             # ensure the request loaded
             await self.wait_request_loading(request_id, timeout=timeout)
         return await self.send(
-            "Network.getResponseBody", requestId=request_id, timeout=timeout
+            "Network.getResponseBody", requestId=request_id, timeout=timeout, raw=raw
         )
 
     async def get_response_body(
-        self, request_dict: Union[None, dict, str], timeout=NotSet, wait_loading=None
-    ) -> Union[dict, None]:
-        """get result.body from self.get_response."""
+        self,
+        request_dict: Union[None, dict, str],
+        timeout=NotSet,
+        wait_loading=None,
+        raw=False,
+    ) -> Union[str, bytes, None]:
+        """get result.body from self.get_response. raw: return the body as bytes."""
         result = await self.get_response(
-            request_dict, timeout=timeout, wait_loading=wait_loading
+            request_dict, timeout=timeout, wait_loading=wait_loading, raw=raw
         )
-        return self.get_data_value(result, value_path="result.body", default="")
+        body = self.get_data_value(result, value_path="result.body", default="")
+        if raw and isinstance(body, str):
+            if self.get_data_value(result, value_path="result.base64Encoded"):
+                return b64decode(body)
+            return body.encode("utf-8")
+        return body
 
     async def get_request_post_data(
         self, request_dict: Union[None, dict, str], timeout=NotSet
@@ -1618,6 +1851,9 @@ class AsyncTab(GetValueMixin):
             )
         if url:
             self._url = url
+            origin = self.get_origin(url)
+            if origin:
+                self._touched_origins.add(origin)
             if referrer is None:
                 data = await self.send("Page.navigate", url=url, timeout=timeout)
             else:
@@ -1861,7 +2097,7 @@ JSON.stringify(result)
 """ % (group_count, cssselector, attribute, act, regex, flags)
         result = await self.js(code, value_path="result.result.value", timeout=timeout)
         if result and result.startswith("["):
-            return json.loads(result)
+            return self.codec.loads(result)
         else:
             return []
 
@@ -2029,8 +2265,10 @@ JSON.stringify(result)""" % (
                 javascript, timeout=timeout, value_path="result.result.value"
             )
             try:
-                items = json.loads(response_items_str) if response_items_str else []
-            except (json.JSONDecodeError, ValueError):
+                items = (
+                    self.codec.loads(response_items_str) if response_items_str else []
+                )
+            except self.codec.errors:
                 items = []
             result = [Tag(**kws) for kws in items]
             if isinstance(index, int):
@@ -2123,10 +2361,10 @@ JSON.stringify(result)""" % (
         rect = await self.js(js_str, timeout=timeout, value_path="result.result.value")
         if rect:
             try:
-                rect = json.loads(rect)
+                rect = self.codec.loads(rect)
                 rect["scale"] = scale
                 return rect
-            except (TypeError, KeyError, json.JSONDecodeError):
+            except (KeyError,) + self.codec.errors:
                 pass
 
     async def snapshot_mhtml(
@@ -2160,9 +2398,10 @@ JSON.stringify(result)""" % (
         save_path=None,
         timeout=NotSet,
         captureBeyondViewport=False,
+        raw=False,
         **kwargs,
     ):
-        "screenshot the tag selected with given css as a picture"
+        "screenshot the tag selected with given css as a picture, return image bytes if raw else base64 string"
         if cssselector:
             clip = await self.get_element_clip(
                 cssselector, scale=scale, captureBeyondViewport=captureBeyondViewport
@@ -2177,6 +2416,7 @@ JSON.stringify(result)""" % (
             save_path=save_path,
             timeout=timeout,
             captureBeyondViewport=captureBeyondViewport,
+            raw=raw,
             **kwargs,
         )
 
@@ -2189,6 +2429,7 @@ JSON.stringify(result)""" % (
         save_path=None,
         timeout=NotSet,
         captureBeyondViewport=False,
+        raw=False,
         **kwargs,
     ):
         """Page.captureScreenshot. clip's keys: x, y, width, height, scale
@@ -2196,7 +2437,8 @@ JSON.stringify(result)""" % (
         format(str, optional): Image compression format (defaults to png)., defaults to 'png'
         quality(int, optional): Compression quality from range [0..100], defaults to None. (jpeg only).
         clip(dict, optional): Capture the screenshot of a given region only. defaults to None, means whole page.
-        fromSurface(bool, optional): Capture the screenshot from the surface, rather than the view. Defaults to true."""
+        fromSurface(bool, optional): Capture the screenshot from the surface, rather than the view. Defaults to true.
+        raw(bool, optional): return the image bytes instead of base64 string, decoded from the raw frame. Defaults to False."""
 
         def save_file(save_path, file_bytes):
             with open(save_path, "wb") as f:
@@ -2209,23 +2451,153 @@ JSON.stringify(result)""" % (
             "Page.captureScreenshot",
             timeout=timeout,
             captureBeyondViewport=captureBeyondViewport,
+            raw=raw,
             **kwargs,
         )
         base64_img = self.get_data_value(result, value_path="result.data")
+        if raw:
+            if isinstance(base64_img, str):
+                base64_img = b64decode(base64_img)
+            if save_path and base64_img:
+                await async_run(save_file, save_path, base64_img)
+            return base64_img
         if save_path and base64_img:
             file_bytes = b64decode(base64_img)
             await async_run(save_file, save_path, file_bytes)
         return base64_img
 
+    async def iter_io_stream(
+        self, handle: str, size: int = None, timeout=NotSet
+    ) -> AsyncIterator[bytes]:
+        """[IO.read] yield the bytes of the stream handle chunk by chunk, and IO.close it at the end.
+
+        Demo::
+
+            async for chunk in tab.iter_io_stream(handle):
+                f.write(chunk)
+        """
+        size = size or self._DEFAULT_STREAM_CHUNK_SIZE
+        try:
+            while True:
+                data = await self.send(
+                    "IO.read", handle=handle, size=size, timeout=timeout, raw=True
+                )
+                result = self.get_data_value(data, "result")
+                if not result:
+                    raise ChromeRuntimeError(f"IO.read {handle} failed: {data}")
+                chunk = result.get("data")
+                if chunk:
+                    if not isinstance(chunk, str):
+                        # bytes decoded by the raw mode
+                        yield chunk
+                    elif result.get("base64Encoded"):
+                        yield b64decode(chunk)
+                    else:
+                        yield chunk.encode("utf-8")
+                if result.get("eof"):
+                    break
+        finally:
+            try:
+                await self.send("IO.close", handle=handle, timeout=0)
+            except ChromeRuntimeError:
+                pass
+
+    async def read_io_stream(
+        self, handle: str, save_path=None, size: int = None, timeout=NotSet
+    ) -> Union[bytes, int]:
+        """Read the stream handle, return the bytes; or write to the save_path and return the file size."""
+        return await self._consume_stream(
+            self.iter_io_stream(handle, size=size, timeout=timeout), save_path
+        )
+
+    @staticmethod
+    async def _consume_stream(
+        chunks: AsyncIterator[bytes], save_path=None
+    ) -> Union[bytes, int]:
+        if not save_path:
+            return b"".join([chunk async for chunk in chunks])
+        file_size = 0
+        f = await async_run(open, save_path, "wb")
+        try:
+            async for chunk in chunks:
+                file_size += await async_run(f.write, chunk)
+        finally:
+            await async_run(f.close)
+        return file_size
+
+    async def print_to_pdf_stream(
+        self, size: int = None, timeout=NotSet, **kwargs
+    ) -> AsyncIterator[bytes]:
+        """[Page.printToPDF] with transferMode=ReturnAsStream, yield the PDF bytes chunk by chunk.
+
+        kwargs: landscape, printBackground, scale, paperWidth, paperHeight, pageRanges...
+        https://chromedevtools.github.io/devtools-protocol/tot/Page/#method-printToPDF
+        """
+        kwargs["transferMode"] = "ReturnAsStream"
+        data = await self.send("Page.printToPDF", timeout=timeout, **kwargs)
+        handle = self.get_data_value(data, "result.stream")
+        if not handle:
+            raise ChromeRuntimeError(f"Page.printToPDF failed: {data}")
+        async for chunk in self.iter_io_stream(handle, size=size, timeout=timeout):
+            yield chunk
+
+    async def print_to_pdf(
+        self, save_path=None, size: int = None, timeout=NotSet, **kwargs
+    ) -> Union[bytes, int]:
+        """[Page.printToPDF] return the PDF bytes; or write to the save_path chunk by chunk and return the file size."""
+        return await self._consume_stream(
+            self.print_to_pdf_stream(size=size, timeout=timeout, **kwargs), save_path
+        )
+
+    async def start_tracing(self, timeout=NotSet, **kwargs):
+        """[Tracing.start] with transferMode=ReturnAsStream, stop it with tab.end_tracing or tab.end_tracing_stream.
+
+        kwargs: traceConfig, streamFormat, streamCompression...
+        https://chromedevtools.github.io/devtools-protocol/tot/Tracing/#method-start
+        """
+        kwargs["transferMode"] = "ReturnAsStream"
+        return await self.send("Tracing.start", timeout=timeout, **kwargs)
+
+    async def end_tracing_stream(
+        self, size: int = None, timeout=NotSet
+    ) -> AsyncIterator[bytes]:
+        """[Tracing.end] wait for Tracing.tracingComplete, and yield the trace bytes chunk by chunk."""
+        task = asyncio.ensure_future(
+            self.wait_event("Tracing.tracingComplete", timeout=timeout)
+        )
+        try:
+            await self.send("Tracing.end", timeout=timeout)
+            event = await task
+        finally:
+            if not task.done():
+                task.cancel()
+        handle = self.get_data_value(event, "params.stream")
+        if not handle:
+            raise ChromeRuntimeError(f"Tracing.tracingComplete without stream: {event}")
+        async for chunk in self.iter_io_stream(handle, size=size, timeout=timeout):
+            yield chunk
+
+    async def end_tracing(
+        self, save_path=None, size: int = None, timeout=NotSet
+    ) -> Union[bytes, int]:
+        """[Tracing.end] return the trace bytes; or write to the save_path chunk by chunk and return the file size."""
+        return await self._consume_stream(
+            self.end_tracing_stream(size=size, timeout=timeout), save_path
+        )
+
     async def add_js_onload(self, source: str, **kwargs) -> str:
         """[Page.addScriptToEvaluateOnNewDocument], return the identifier [str]."""
         data = await self.send(
             "Page.addScriptToEvaluateOnNewDocument", source=source, **kwargs
         )
-        return self.get_data_value(data, value_path="result.identifier") or ""
+        identifier = self.get_data_value(data, value_path="result.identifier") or ""
+        if identifier:
+            self._js_onload_ids.add(identifier)
+        return identifier
 
     async def remove_js_onload(self, identifier: str, timeout=NotSet) -> bool:
         """[Page.removeScriptToEvaluateOnNewDocument], return whether the identifier exist."""
+        self._js_onload_ids.discard(identifier)
         result = await self.send(
             "Page.removeScriptToEvaluateOnNewDocument",
             identifier=identifier,
@@ -2233,6 +2605,103 @@ JSON.stringify(result)""" % (
         )
         return self.check_error("remove_js_onload", result, identifier=identifier)
 
+    async def get_performance_metrics(self, timeout=NotSet) -> Dict[str, float]:
+        """[Performance.getMetrics] return the metrics dict, like {"Nodes": 5, "JSHeapUsedSize": 880760, ...}, or {} for failure."""
+        data = await self.send("Performance.getMetrics", timeout=timeout)
+        metrics = self.get_data_value(data, value_path="result.metrics") or []
+        return {item["name"]: item["value"] for item in metrics}
+
+    @staticmethod
+    def get_origin(url: str) -> str:
+        "scheme://netloc of the http(s) url, else empty string"
+        parsed = urlparse(url)
+        if parsed.scheme in {"http", "https"} and parsed.netloc:
+            return f"{parsed.scheme}://{parsed.netloc}"
+        return ""
+
+    _ORIGIN_EVENTS = {
+        "Page.frameNavigated",
+        "Target.attachedToTarget",
+        "Target.targetInfoChanged",
+    }
+
+    def _collect_origins(self, tab, data_dict):
+        "the default_recv_callback added by track_origins"
+        method = data_dict.get("method")
+        if method not in self._ORIGIN_EVENTS:
+            return
+        params = data_dict.get("params") or {}
+        info = params.get("frame") or params.get("targetInfo") or {}
+        origin = self.get_origin(info.get("url") or "")
+        if origin:
+            self._touched_origins.add(origin)
+
+    async def track_origins(self, timeout=NotSet) -> bool:
+        """Collect the origins of the frames and workers from the events, to be cleared by reset_state or the pooled browser context.
+
+        Page.frameNavigated: the main frame (after the redirects) and the iframes in the same process.
+        Target.attachedToTarget (auto attach): the out-of-process iframes, workers and service workers.
+        The subresources can not write the storage except the cookies, which are cleared for the whole browser context.
+        """
+        if self._collect_origins not in self._default_recv_callback:
+            self._default_recv_callback.append(self._collect_origins)
+        results = await self.send_many(
+            [
+                "Page.enable",
+                (
+                    "Target.setAutoAttach",
+                    {
+                        "autoAttach": True,
+                        "waitForDebuggerOnStart": False,
+                        "flatten": True,
+                    },
+                ),
+            ],
+            timeout=timeout,
+            auto_enable=False,
+        )
+        return all((result and "result" in result for result in results))
+
+    async def reset_state(self, origins: List[str] = None, timeout=NotSet) -> bool:
+        """Reset the tab for the next task, so it can be recycled instead of creating a new one.
+
+        1. navigate to about:blank
+        2. clear the storage (cookies, localStorage, cache...) of the origins touched by set_url / goto / track_origins, the current origin and the given origins
+        3. remove the scripts of add_js_onload
+        4. restore the extra headers / User-Agent overrides
+
+        Return False if any step failed, then the tab should be closed instead of recycled.
+        The storage is cleared for the whole browser context, so use it for the tab owning a browser context,
+        not the tabs sharing the default context and the profile.
+        """
+        timeout = self.ensure_timeout(timeout)
+        origins = set(origins or ())
+        current_origin = await self.get_variable("window.location.origin", timeout=timeout)
+        if isinstance(current_origin, str):
+            origins.add(self.get_origin(current_origin))
+        origins.update(self._touched_origins)
+        origins.discard("")
+        commands: list = [("Page.navigate", {"url": "about:blank"})]
+        for origin in origins:
+            commands.append(
+                (
+                    "Storage.clearDataForOrigin",
+                    {"origin": origin, "storageTypes": "all"},
+                )
+            )
+        for identifier in self._js_onload_ids:
+            commands.append(
+                ("Page.removeScriptToEvaluateOnNewDocument", {"identifier": identifier})
+            )
+        for method in self._overridden_methods:
+            commands.append(self._RESET_STATE_METHODS[method])
+        results = await self.send_many(commands, timeout=timeout, auto_enable=False)
+        self._touched_origins.clear()
+        self._js_onload_ids.clear()
+        self._overridden_methods.clear()
+        self._url = "about:blank"
+        return all((result and "result" in result for result in results))
+
     async def get_screen_size(self, timeout=NotSet):
         "get [window.screen.width, window.screen.height] with javascript"
         return await self.get_value(
@@ -2247,12 +2716,13 @@ JSON.stringify(result)""" % (
         )
 
     async def keyboard_send(
-        self, *, type="char", timeout=NotSet, string=None, **kwargs
+        self, *, type="char", timeout=NotSet, string=None, pipeline=False, **kwargs
     ):
         """[Input.dispatchKeyEvent]
 
         type: keyDown, keyUp, rawKeyDown, char.
         string: will be split into chars.
+        pipeline: send the chars of string with tab.send_many, without waiting for each response.
 
         kwargs:
             text, unmodifiedText, keyIdentifier, code, key...
@@ -2268,6 +2738,15 @@ JSON.stringify(result)""" % (
                 https://developer.mozilla.org/en-US/docs/Web/API/KeyboardEvent/keyIdentifier
         """
         if string:
+            if pipeline:
+                results = await self.send_many(
+                    [
+                        ("Input.dispatchKeyEvent", {"type": "char", "text": char})
+                        for char in string
+                    ],
+                    timeout=timeout,
+                )
+                return results[-1]
             result = None
             for char in string:
                 result = await self.keyboard_send(text=char, timeout=timeout)
@@ -2298,8 +2777,31 @@ JSON.stringify(result)""" % (
                 x=x, y=y, button=button, count=1, timeout=timeout
             )
 
-    async def mouse_click(self, x, y, button="left", count=1, timeout=NotSet):
-        "click a position"
+    async def mouse_click(
+        self, x, y, button="left", count=1, timeout=NotSet, pipeline=False
+    ):
+        "click a position. pipeline: send mousePressed & mouseReleased with tab.send_many"
+        if pipeline:
+            results = await self.send_many(
+                [
+                    (
+                        "Input.dispatchMouseEvent",
+                        dict(
+                            type="mousePressed",
+                            x=x,
+                            y=y,
+                            button=button,
+                            clickCount=count,
+                        ),
+                    ),
+                    (
+                        "Input.dispatchMouseEvent",
+                        dict(type="mouseReleased", x=x, y=y, button=button, clickCount=1),
+                    ),
+                ],
+                timeout=timeout,
+            )
+            return results[-1]
         await self.mouse_press(x=x, y=y, button=button, count=count, timeout=timeout)
         return await self.mouse_release(
             x=x, y=y, button=button, count=1, timeout=timeout
@@ -2689,9 +3191,14 @@ True
             return
         else:
             self.flatten = True
-            self._listener = self.browser._listener
-            self._buffers = self.browser._buffers
-            self.ws = self.browser.ws
+            self._bind_browser(self._browser_shard or self.chrome.browser)
+
+    def _bind_browser(self, browser: "AsyncTab"):
+        "share the ws / Listener / buffers of the given browser connection in flatten mode"
+        self._browser_shard = browser
+        self._listener = browser._listener
+        self._buffers = browser._buffers
+        self.ws = browser.ws
 
     def __hash__(self):
         return self.tab_id
@@ -2748,7 +3255,8 @@ True
                 raise ChromeTypeError(
                     f"callback function ({getattr(func, '__name__', func)}) should be callable"
                 )
-            if not inspect.isbuiltin(func) and len(func.__code__.co_varnames) != 2:
+            code = getattr(func, "__code__", None)
+            if code and not inspect.isbuiltin(func) and len(code.co_varnames) != 2:
                 raise ChromeTypeError(
                     f"callback function ({getattr(func, '__name__', func)}) should handle two args for {must_args}"
                 )
@@ -2781,19 +3289,15 @@ True
 
     @property
     def browser(self) -> "AsyncTab":
-        return self.chrome.browser
+        return self._browser_shard or self.chrome.browser
 
     def handle_process_gone_error(self, tab: "AsyncTab"):
         if tab is None:
             return
         # raise error for listener futures
-        _error = ChromeProcessMissingError("missing process")
-        while True:
-            try:
-                _, f = tab._listener._registered_futures.popitem()
-                f.set_exception(_error)
-            except (IndexError, KeyError):
-                break
+        tab._listener.set_exception(
+            ChromeProcessMissingError("missing process"), session_id=tab._session_id
+        )
         logger.debug(f"[missing] missing chrome process Tab({tab.id}).")
 
     async def _recv_daemon(self):
@@ -2830,12 +3334,28 @@ True
             data_str = msg.data
             if not data_str:
                 continue
+            if self._PREFILTER_EVENTS:
+                event = self._peek_event(data_str)
+                if event and not self._is_event_wanted(*event):
+                    self._recv_frames_skipped += 1
+                    continue
+            self._recv_frames_decoded += 1
             try:
-                data_dict = json.loads(data_str)
+                data_dict = None
+                if self._listener.raw_fields and data_str.startswith('{"id":'):
+                    data_dict = await self._decode_raw_frame(data_str)
+                if data_dict is not None:
+                    pass
+                elif self._OFFLOAD_DECODE_SIZE and len(data_str) > self._OFFLOAD_DECODE_SIZE:
+                    # the daemon waits for the thread, so the order of messages is kept
+                    self._recv_frames_offloaded += 1
+                    data_dict = await self._offload_decode(data_str)
+                else:
+                    data_dict = self.codec.loads(data_str)
                 # ignore non-dict type msg.data
                 if not isinstance(data_dict, dict):
                     continue
-            except (TypeError, json.decoder.JSONDecodeError):
+            except self.codec.errors:
                 logger.debug(f"[json] data_str can not be json.loads: {data_str}")
                 continue
             # {"method":"Inspector.detached","params":{"reason":"Render process gone."},"sessionId":"9B732FA5900F6CE37B7B647D99B74897"}
@@ -2860,34 +3380,162 @@ True
                     continue
                 default_recv_callback = self.default_recv_callback
             for callback in default_recv_callback:
-                asyncio.ensure_future(ensure_awaitable(callback(self, data_dict)))
-            buffer: asyncio.Queue = self._buffers.get(data_dict.get("method"))
+                # sync callbacks run inline, only the awaitable result needs a task
+                result = callback(self, data_dict)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            if self._target_registry is not None:
+                self._target_registry.feed(data_dict)
+            buffer: EventBuffer = self._buffers.get(data_dict.get("method"))
             if buffer:
-                asyncio.ensure_future(buffer.put(data_dict))
+                if buffer.overflow == "block" and buffer.full():
+                    # backpressure: stop reading the ws until the consumer gets one
+                    await buffer.feed_wait(data_dict)
+                else:
+                    buffer.feed(data_dict)
             f = self._listener.pop_future(data_dict)
             if f and f._state == _PENDING:
                 f.set_result(data_dict)
         logger.debug(f"[break] {self!r} _recv_daemon loop break.")
+        self._flush_recv_callbacks()
         if self._recv_daemon_break_callback:
             return await _ensure_awaitable_callback_result(
                 self._recv_daemon_break_callback, self
             )
 
+    async def _decode_raw_frame(self, data_str: str) -> Optional[dict]:
+        """Decode the response of the raw mode request, the base64 field is decoded into bytes chunk by chunk.
+        Return None for the other frames, and the frames should be decoded as usual.
+
+        {"id":3,"result":{"data":"iVBORw0KGgo..."},"sessionId":"9B732FA5900F6CE37B7B647D99B74897"}
+        """
+        end = data_str.find(",", 6)
+        if end < 0:
+            return None
+        try:
+            msg_id = int(data_str[6:end])
+        except ValueError:
+            return None
+        field = self._listener.raw_fields.pop(msg_id, None)
+        if field is None:
+            return None
+        key = f'"{field}":"'
+        start = data_str.find(key)
+        if start < 0:
+            # error response
+            return None
+        start += len(key)
+        end = data_str.find('"', start)
+        if end < 0 or data_str.find("\\", start, end) >= 0:
+            return None
+        # decode the frame without the payload
+        try:
+            data_dict = self.codec.loads(data_str[:start] + data_str[end:])
+        except self.codec.errors:
+            return None
+        result = data_dict.get("result")
+        if not isinstance(result, dict) or result.get(field) != "":
+            return None
+        if result.get("base64Encoded") is False:
+            # not base64, the text body
+            return None
+        payload = bytearray()
+        chunk_size = self._RAW_DECODE_CHUNK_SIZE
+        for index in range(start, end, chunk_size):
+            payload += a2b_base64(data_str[index : min(index + chunk_size, end)])
+            # let the other tasks run, the next frame waits for this one
+            await asyncio.sleep(0)
+        # bytes like b64decode, bytearray is not accepted by some consumers, such as starlette Response
+        result[field] = bytes(payload)
+        return data_dict
+
+    async def _offload_decode(self, data_str: str):
+        if self._OFFLOAD_DECODE_EXECUTOR is None:
+            return await async_run(self.codec.loads, data_str)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._OFFLOAD_DECODE_EXECUTOR, self.codec.loads, data_str
+        )
+
+    def _flush_recv_callbacks(self):
+        "flush the pending messages of the BatchRecvCallback while the _recv_daemon break"
+        tabs = [self]
+        tabs.extend(self._sessions.values())
+        for tab in tabs:
+            for callback in tab.default_recv_callback:
+                if isinstance(callback, BatchRecvCallback):
+                    callback.flush()
+
+    @staticmethod
+    def _peek_event(data_str: str):
+        """Read (method, sessionId) from the raw event frame without decoding the whole JSON.
+        Return None for the non-event frames or the frames with unknown layout, which should be decoded.
+
+        {"method":"Network.dataReceived","params":{...},"sessionId":"9B732FA5900F6CE37B7B647D99B74897"}
+        """
+        if not data_str.startswith('{"method":"'):
+            return None
+        end = data_str.find('"', 11)
+        if end < 0:
+            return None
+        if data_str.endswith('"}'):
+            # the last top-level value of the event is a string, it should be the sessionId
+            start = data_str.rfind(',"sessionId":"')
+            if start >= 0:
+                session_id = data_str[start + 14 : -2]
+                if '"' not in session_id:
+                    return data_str[11:end], session_id
+        if '"sessionId":' in data_str:
+            # the sessionId is not the last key, or nested in the params, can not tell without decoding
+            return None
+        return data_str[11:end], None
+
+    def _is_event_wanted(self, method: str, session_id: Optional[str]) -> bool:
+        "check whether any Listener future / EventBuffer / default_recv_callback wants this event."
+        if method in self._ALWAYS_DECODE_EVENTS or method in self._buffers:
+            return True
+        if self._target_registry is not None and method in TargetRegistry.EVENTS:
+            return True
+        if self._listener.wants_event(method, session_id):
+            return True
+        if session_id:
+            _tab = self._sessions.get(session_id)
+            return bool(_tab and _tab.default_recv_callback)
+        return bool(self.default_recv_callback)
+
+    @property
+    def listener_stats(self) -> Dict[str, int]:
+        """Counters of the Listener futures.
+        pending: futures waiting for the messages; leaked: futures cleared after the deadline."""
+        return self._listener.stats
+
+    @property
+    def recv_stats(self) -> Dict[str, int]:
+        """Counters of the frames received by the _recv_daemon.
+        decoded: frames decoded by the codec; skipped: event frames dropped by the prefilter;
+        offloaded: large frames decoded by the _OFFLOAD_DECODE_EXECUTOR."""
+        return {
+            "decoded": self._recv_frames_decoded,
+            "skipped": self._recv_frames_skipped,
+            "offloaded": self._recv_frames_offloaded,
+        }
+
     async def _recv(self, event_dict, timeout, callback_function) -> Union[dict, None]:
         error = None
+        f = None
         try:
             result = None
             await self.auto_enable(event_dict, timeout=timeout)
-            f = self._listener.register(event_dict)
+            f = self._listener.register(event_dict, timeout=timeout)
             result = await asyncio.wait_for(f, timeout=timeout)
-            self._listener.unregister(event_dict)
         except asyncio.TimeoutError:
             logger.debug(f"[timeout] {event_dict} [recv] timeout({timeout}).")
-            self._listener.unregister(event_dict)
         except Exception as e:
             logger.debug(f"[error] {event_dict} [recv] {e!r}.")
             error = e
         finally:
+            # unregister for the cancelled / failed waiting too, or the next one will get duplicated key
+            if f is not None:
+                self._listener.unregister(event_dict, f)
             if error:
                 raise error
             else:
@@ -2941,8 +3589,8 @@ True
             )
             try:
                 if result:
-                    return json.loads(result)
-            except (TypeError, json.decoder.JSONDecodeError):
+                    return self.codec.loads(result)
+            except self.codec.errors:
                 pass
             return result
         else:
@@ -3046,14 +3694,157 @@ class OffsetDragWalker(OffsetMoveWalker):
         return self
 
 
-class Listener:
-    _SINGLETON_EVENT_KEY = True
+class BatchRecvCallback:
+    """Wrap the callback(tab, batch) as a default_recv_callback, which is called with a list of messages instead of each message.
+
+    Flush the batch while `batch_size` messages collected, or `interval` seconds after the first message, or the _recv_daemon break.
+
+    Demo::
+
+        def log_messages(tab, batch):
+            print(tab, len(batch))
+
+        tab.default_recv_callback.append(BatchRecvCallback(log_messages, batch_size=500, interval=1))
+    """
+
+    def __init__(
+        self,
+        callback: Callable,
+        batch_size: int = 100,
+        interval: Union[float, int] = 1,
+    ):
+        if not callable(callback):
+            raise ChromeTypeError(
+                f"callback function ({getattr(callback, '__name__', callback)}) should be callable"
+            )
+        self.callback = callback
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        # {id(tab): (tab, [data_dict, ...])}
+        self._batches: Dict[int, Tuple["AsyncTab", list]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __call__(self, tab: "AsyncTab", data_dict: dict):
+        key = id(tab)
+        item = self._batches.get(key)
+        if item is None:
+            item = self._batches[key] = (tab, [])
+        batch = item[1]
+        batch.append(data_dict)
+        if len(batch) >= self.batch_size:
+            self._flush_batch(key)
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.interval, self.flush
+            )
+
+    def _flush_batch(self, key):
+        tab, batch = self._batches.pop(key)
+        result = self.callback(tab, batch)
+        if inspect.isawaitable(result):
+            asyncio.ensure_future(result)
+
+    def flush(self):
+        "call the callback with all the pending messages"
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for key in list(self._batches):
+            self._flush_batch(key)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(item[1]) for item in self._batches.values())
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}({getattr(self.callback, '__name__', self.callback)}): batch_size={self.batch_size}, interval={self.interval}>"
+
+
+class TargetRegistry:
+    """In-memory targets of the browser, updated by the Target.setDiscoverTargets events:
+    Target.targetCreated / Target.targetInfoChanged / Target.targetDestroyed
+
+    targetInfo: {'targetId': '...', 'type': 'page', 'title': '', 'url': 'about:blank', 'attached': False, 'canAccessOpener': False, 'browserContextId': '...'}
+    """
+
+    EVENTS = {
+        "Target.targetCreated",
+        "Target.targetInfoChanged",
+        "Target.targetDestroyed",
+    }
 
     def __init__(self):
-        self._registered_futures = WeakValueDictionary()
+        # {targetId: targetInfo}, ordered by created time
+        self._targets: Dict[str, dict] = {}
 
-    @staticmethod
-    def _normalize_dict(dict_obj):
+    def feed(self, data_dict: dict):
+        method = data_dict.get("method")
+        if method not in self.EVENTS or "sessionId" in data_dict:
+            return
+        params = data_dict.get("params") or {}
+        if method == "Target.targetDestroyed":
+            self._targets.pop(params.get("targetId"), None)
+        else:
+            self.update(params.get("targetInfo"))
+
+    def update(self, target_info: dict):
+        if target_info and target_info.get("targetId"):
+            target_id = target_info["targetId"]
+            if target_id in self._targets:
+                self._targets[target_id].update(target_info)
+            else:
+                self._targets[target_id] = target_info
+
+    def get(self, target_id: str) -> Optional[dict]:
+        return self._targets.get(target_id)
+
+    def get_targets(self, type: Optional[str] = "page") -> List[dict]:
+        "target infos, the newest first. type=None for all types"
+        return [
+            target_info
+            for target_info in reversed(self._targets.values())
+            if type is None or target_info.get("type") == type
+        ]
+
+    def clear(self):
+        self._targets.clear()
+
+    def __len__(self):
+        return len(self._targets)
+
+    def __contains__(self, target_id):
+        return target_id in self._targets
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {len(self)} targets>"
+
+
+class Listener:
+    """Futures waiting for the ws messages, kept in separate tables with tuple keys:
+
+        responses: (id, sessionId)
+        events: (method, sessionId)
+        others: (normalized event_dict, sessionId)
+
+    Futures are strong referenced until popped / unregistered, the ones still registered after the deadline will be cleared as leaked."""
+
+    _SINGLETON_EVENT_KEY = True
+    # clear the expired futures every N seconds, and the futures expired N seconds ago are leaked
+    _CLEAR_INTERVAL = 60
+
+    def __init__(self, codec: JSONCodec = None):
+        self.codec: JSONCodec = codec or AsyncTab._DEFAULT_CODEC
+        # {key: (future, deadline)}
+        self._id_futures: Dict[tuple, tuple] = {}
+        self._event_futures: Dict[tuple, tuple] = {}
+        self._json_futures: Dict[tuple, tuple] = {}
+        self._tables = (self._id_futures, self._event_futures, self._json_futures)
+        # {id: field} of the raw mode requests
+        self.raw_fields: Dict[int, str] = {}
+        self._next_clear_time = time.time() + self._CLEAR_INTERVAL
+        self._leaked = 0
+
+    def _normalize_dict(self, dict_obj):
         """input a dict_obj, return the hashable item list."""
         if not dict_obj:
             return None
@@ -3061,58 +3852,128 @@ class Listener:
         for item in dict_obj.items():
             key = item[0]
             try:
-                value = json.dumps(item[1], sort_keys=1)
-            except TypeError:
+                value = self.codec.dumps(item[1], sort_keys=True)
+            except self.codec.errors:
                 value = str(item[1])
             result.append((key, value))
         return tuple(result)
 
     def _arg_to_key(self, event_dict):
+        "return the (table, key) of event_dict"
         if not isinstance(event_dict, dict):
             logger.error(
                 "Listener event_dict should be dict type, such as {'id': 1} or {'method': 'Page.loadEventFired'}"
             )
         if "id" in event_dict:
             # id is unique
-            key = f"id={event_dict['id']}"
+            return self._id_futures, (event_dict["id"], event_dict.get("sessionId"))
         elif "method" in event_dict:
             # method may be duplicate
-            key = f"method={event_dict['method']}"
+            return self._event_futures, (
+                event_dict["method"],
+                event_dict.get("sessionId"),
+            )
         else:
-            key = f"json={self._normalize_dict(event_dict)}"
-        return f"{key}@{event_dict.get('sessionId')}"
+            return self._json_futures, (
+                self._normalize_dict(event_dict),
+                event_dict.get("sessionId"),
+            )
 
-    def register(self, event_dict: dict):
-        """Listener will register a event_dict, such as {'id': 1} or {'method': 'Page.loadEventFired'}, maybe the dict doesn't has key [method]."""
-        key = self._arg_to_key(event_dict)
-        if key in self._registered_futures:
+    def register(self, event_dict: dict, timeout: Union[int, float] = None):
+        """Listener will register a event_dict, such as {'id': 1} or {'method': 'Page.loadEventFired'}, maybe the dict doesn't has key [method].
+        The future will be cleared as leaked if it is still registered after `timeout` seconds."""
+        now = time.time()
+        if now > self._next_clear_time:
+            self.clear_expired(now)
+        table, key = self._arg_to_key(event_dict)
+        if key in table:
             msg = f"Event key duplicated: {key}"
             logger.warning(msg)
             if self._SINGLETON_EVENT_KEY:
                 raise ChromeValueError(msg)
         f: Future = Future()
-        self._registered_futures[key] = f
+        table[key] = (f, INF if timeout is None else now + timeout)
         return f
 
+    def has_event(self, method: str, session_id: str = None) -> bool:
+        "whether a future is waiting for the event method"
+        return (method, session_id) in self._event_futures
+
+    def wants_event(self, method: str, session_id: str = None) -> bool:
+        "whether any future may be resolved by the event, the json futures are matched after decoding"
+        return (method, session_id) in self._event_futures or bool(self._json_futures)
+
     def find_future(self, event_dict, default=None):
-        key = self._arg_to_key(event_dict)
-        return self._registered_futures.get(key, default)
+        table, key = self._arg_to_key(event_dict)
+        item = table.get(key)
+        return default if item is None else item[0]
 
     def pop_future(self, event_dict, default=None):
-        key = self._arg_to_key(event_dict)
-        return self._registered_futures.pop(key, default)
-
-    def unregister(self, event_dict: dict):
-        f = self.pop_future(event_dict)
-        if f:
-            del f
-            return True
-        else:
+        table, key = self._arg_to_key(event_dict)
+        item = table.pop(key, None)
+        return default if item is None else item[0]
+
+    def unregister(self, event_dict: dict, future: Future = None):
+        "unregister the event_dict, only if it is registered with the given future"
+        table, key = self._arg_to_key(event_dict)
+        item = table.get(key)
+        if item is None or (future is not None and item[0] is not future):
             return False
+        del table[key]
+        return True
+
+    def set_exception(self, error: Exception, session_id: str = None):
+        "pop the futures of the session_id (all the futures if session_id is None), and set the error."
+        for table in self._tables:
+            if session_id is None:
+                items = list(table.values())
+                table.clear()
+            else:
+                keys = [key for key in table if key[1] == session_id]
+                items = [table.pop(key) for key in keys]
+            for f, _ in items:
+                if not f.done():
+                    f.set_exception(error)
+
+    def clear_expired(self, now: float = None):
+        "clear the futures registered but not unregistered after the deadline."
+        now = now or time.time()
+        self._next_clear_time = now + self._CLEAR_INTERVAL
+        deadline = now - self._CLEAR_INTERVAL
+        for table in self._tables:
+            keys = [key for key, item in table.items() if item[1] < deadline]
+            for key in keys:
+                f, _ = table.pop(key)
+                if not f.done():
+                    f.cancel()
+            self._leaked += len(keys)
+
+    @property
+    def pending(self) -> int:
+        "the amount of registered futures"
+        return sum(len(table) for table in self._tables)
+
+    @property
+    def leaked(self) -> int:
+        "the amount of futures cleared for not unregistered after the deadline"
+        return self._leaked
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self.pending, "leaked": self.leaked}
 
 
 class AsyncChrome(GetValueMixin):
     _DEFAULT_CONNECT_TIMEOUT = 3
+    # browser-level ws connections for the flatten mode sessions
+    _DEFAULT_SHARDS = 1
+    # least_loaded / round_robin
+    _DEFAULT_SHARD_STRATEGY = "least_loaded"
+    SHARD_STRATEGIES = ("least_loaded", "round_robin")
+    # get_tabs / get_tab from the TargetRegistry fed by the browser events, instead of HTTP /json
+    _DEFAULT_TARGET_REGISTRY = False
+    # new_tab / close_tab / activate_tab / get_tabs / get_version with the Target & Browser domain over the browser ws, fallback to HTTP
+    _DEFAULT_PREFER_CDP = False
 
     def __init__(
         self,
@@ -3120,15 +3981,64 @@ class AsyncChrome(GetValueMixin):
         port: int = 9222,
         timeout: Optional[int] = None,
         retry: Optional[int] = None,  # deprecated
+        codec: JSONCodec = None,
+        shards: Optional[int] = None,
+        shard_strategy: Optional[str] = None,
+        target_registry: Optional[bool] = None,
+        prefer_cdp: Optional[bool] = None,
+        ws_url: Optional[str] = None,
+        pipe: Optional[PipeWebSocket] = None,
     ):
+        # ws://127.0.0.1:9222/devtools/browser/<id>, connect the browser ws directly without the HTTP discovery
+        self.ws_url = ws_url
+        # the connected PipeWebSocket of the chrome launched with --remote-debugging-pipe, no HTTP or ws at all
+        self.pipe = pipe
+        if pipe:
+            port = None
+            # only one browser connection for the pipe
+            shards = 1
+            prefer_cdp = True
+        if ws_url:
+            parsed = urlparse(ws_url)
+            if parsed.scheme not in {"ws", "wss"} or "/devtools/browser/" not in parsed.path:
+                raise ChromeValueError(
+                    f"ws_url should be like ws://127.0.0.1:9222/devtools/browser/<id>, not {ws_url}"
+                )
+            host, port = parsed.hostname, parsed.port
+            # the HTTP endpoints may be unavailable
+            prefer_cdp = True
         self.host = host
         # port can be null for chrome address without port.
         self.port = port
         self.timeout = timeout or self._DEFAULT_CONNECT_TIMEOUT
+        # JSON codec shared by the tabs, default to AsyncTab._DEFAULT_CODEC
+        self.codec: Optional[JSONCodec] = codec
         self.retry = retry
         self.status = "init"
         self._req: Optional[ClientSession] = None
         self._browser: Optional[AsyncTab] = None
+        # each shard is a browser-level AsyncTab with its own _recv_daemon
+        self.shards = max(1, shards or self._DEFAULT_SHARDS)
+        self.shard_strategy = shard_strategy or self._DEFAULT_SHARD_STRATEGY
+        if self.shard_strategy not in self.SHARD_STRATEGIES:
+            raise ChromeValueError(
+                f"shard_strategy should be one of {self.SHARD_STRATEGIES}, not {self.shard_strategy}"
+            )
+        self._browsers: List[AsyncTab] = []
+        self._shard_cursor = 0
+        self.prefer_cdp: bool = (
+            self._DEFAULT_PREFER_CDP if prefer_cdp is None else prefer_cdp
+        )
+        self.targets: Optional[TargetRegistry] = (
+            TargetRegistry()
+            if (
+                self._DEFAULT_TARGET_REGISTRY
+                if target_registry is None
+                else target_registry
+            )
+            else None
+        )
+        self._shard_stats_cache: Dict[int, tuple] = {}
 
     @property
     def browser(self) -> AsyncTab:
@@ -3136,22 +4046,130 @@ class AsyncChrome(GetValueMixin):
             return self._browser
         raise ChromeRuntimeError("`async with` context needed.")
 
+    @property
+    def browsers(self) -> List[AsyncTab]:
+        "all the browser-level connections, browsers[0] is the self.browser"
+        return self._browsers
+
+    @classmethod
+    def from_ws_url(cls, ws_url: str, **kwargs) -> "AsyncChrome":
+        """Connect the browser ws directly, skip the HEAD and /json/version requests.
+
+        Demo::
+
+            async with AsyncChrome.from_ws_url("ws://127.0.0.1:9222/devtools/browser/b5fbd149-959b-4603-b209-cfd26d66bdc1") as chrome:
+                async with chrome.connect_tab(None, auto_close=True) as tab:
+                    await tab.goto("http://httpbin.org/ip")
+        """
+        return cls(ws_url=ws_url, **kwargs)
+
+    @staticmethod
+    def load_manifest(manifest_path) -> List[dict]:
+        "the browsers of the manifest written by ChromeWorkers(manifest_path=...)"
+        with open(manifest_path, encoding="utf-8") as f:
+            return AsyncTab._DEFAULT_CODEC.loads(f.read()).get("browsers") or []
+
+    @classmethod
+    def from_manifest(
+        cls, manifest_path, port: int = None, index: int = 0, **kwargs
+    ) -> "AsyncChrome":
+        """Attach the browser of the ChromeWorkers manifest by port (or index), without probing the ports.
+
+        Demo::
+
+            async with AsyncChrome.from_manifest("chrome_workers.json", port=9222) as chrome:
+                pass
+        """
+        browsers = cls.load_manifest(manifest_path)
+        if port is not None:
+            browsers = [item for item in browsers if item.get("port") == port]
+            index = 0
+        try:
+            item = browsers[index]
+        except IndexError:
+            raise ChromeValueError(
+                f"browser not found in {manifest_path}, port={port}, index={index}"
+            )
+        if not item.get("ws_url"):
+            raise ChromeRuntimeError(f"browser is not ready: {item}")
+        return cls(ws_url=item["ws_url"], **kwargs)
+
     async def init_browser_tab(self):
         if self._browser:
             raise ChromeRuntimeError("`async with` context is already in use.")
-        version = await self.version
-        # print(version)
-        self._browser = AsyncTab(
-            tab_id="browser",
-            type="browser",
-            webSocketDebuggerUrl=version["webSocketDebuggerUrl"],
-            chrome=self,
-            flatten=False,
-        )
-        await self._browser.ws_connection.__aenter__()
+        if self.pipe:
+            ws_url = "pipe://browser"
+        elif self.ws_url:
+            ws_url = self.ws_url
+        else:
+            version = await self.version
+            ws_url = version["webSocketDebuggerUrl"]
+        for _ in range(self.shards):
+            browser = AsyncTab(
+                tab_id="browser",
+                type="browser",
+                webSocketDebuggerUrl=ws_url,
+                chrome=self,
+                flatten=False,
+            )
+            if self.pipe:
+                browser.ws = self.pipe
+            await browser.ws_connection.__aenter__()
+            self._browsers.append(browser)
+        self._browser = self._browsers[0]
         self.status = "connected"
+        if self.targets is not None:
+            await self.init_target_registry()
         return self._browser
 
+    async def init_target_registry(self):
+        "discover the targets with the browser connection, and seed the registry with Target.getTargets"
+        self.targets.clear()
+        self._browser._target_registry = self.targets
+        await self._browser.send("Target.setDiscoverTargets", discover=True)
+        data = await self._browser.send("Target.getTargets")
+        for target_info in self._browser.get_data_value(
+            data, "result.targetInfos", default=[]
+        ):
+            self.targets.update(target_info)
+
+    def pick_browser(self) -> AsyncTab:
+        "pick a browser connection for the new flatten mode session, with the shard_strategy"
+        browsers = [
+            browser for browser in self._browsers if browser.status == "connected"
+        ]
+        if len(browsers) < 2:
+            return self.browser
+        if self.shard_strategy == "round_robin":
+            self._shard_cursor += 1
+            return browsers[self._shard_cursor % len(browsers)]
+        return min(browsers, key=lambda browser: len(browser._sessions))
+
+    def shard_stats(self) -> List[dict]:
+        """Message rate of each browser connection, to tune the shards.
+
+        rate: frames per second since the last call (or since connected)."""
+        now = time.time()
+        result = []
+        for index, browser in enumerate(self._browsers):
+            frames = browser._recv_frames_decoded + browser._recv_frames_skipped
+            last_time, last_frames = self._shard_stats_cache.get(
+                index, (browser._created_time, 0)
+            )
+            self._shard_stats_cache[index] = (now, frames)
+            rate = (frames - last_frames) / max(now - last_time, 0.001)
+            result.append(
+                {
+                    "index": index,
+                    "status": browser.status,
+                    "sessions": len(browser._sessions),
+                    "frames": frames,
+                    "rate": round(rate, 1),
+                    **browser.recv_stats,
+                }
+            )
+        return result
+
     def __getitem__(
         self, index: Union[int, str] = 0
     ) -> Awaitable[Union[AsyncTab, None]]:
@@ -3165,13 +4183,28 @@ class AsyncChrome(GetValueMixin):
     async def __aexit__(self, *args):
         await self.close()
 
-    async def close(self):
+    async def close(self, keep_pipe=False):
+        "keep_pipe: only stop reading the pipe, so the pipe can be connected by a new AsyncChrome"
+        if self.status == "connected":
+            for browser in self._browsers:
+                if keep_pipe and self.pipe:
+                    await browser.ws_connection.detach()
+                else:
+                    await browser.ws_connection.__aexit__(None, None, None)
+        self._browsers.clear()
+        self._browser = None
         self.status = "disconnected"
         if self._req:
             await self._req.close()
-        if self.status == "connected":
-            await self._browser.ws_connection.__aexit__(None, None, None)
-            self._browser = None
+
+    @property
+    def connected(self) -> bool:
+        "the HTTP session and the browser ws are both alive"
+        return (
+            self.status == "connected"
+            and bool(self._req and not self._req.closed)
+            and bool(self._browser and self._browser.status == "connected")
+        )
 
     async def close_browser(self):
         tab0 = await self.get_tab(0)
@@ -3195,9 +4228,39 @@ class AsyncChrome(GetValueMixin):
         else:
             return prefix
 
+    @property
+    def use_cdp(self) -> bool:
+        "use the browser ws instead of the HTTP endpoints"
+        return bool(
+            self.prefer_cdp and self._browser and self._browser.status == "connected"
+        )
+
+    async def _send_cdp(self, method: str, **kwargs) -> Optional[dict]:
+        "send with the browser ws, return None for the failure to fallback to HTTP"
+        try:
+            data = await self.browser.send(method, timeout=self.timeout, **kwargs)
+        except ChromeRuntimeError as error:
+            logger.debug(f"[{method}] {self} failed: {error!r}")
+            return None
+        if data and "result" in data:
+            return data["result"]
+        logger.debug(f"[{method}] {self} failed: {data}")
+        return None
+
     async def get_version(self) -> dict:
         """`await self.get_version()`
-        /json/version"""
+        /json/version, or Browser.getVersion if self.use_cdp"""
+        if self.use_cdp:
+            result = await self._send_cdp("Browser.getVersion")
+            if result:
+                return {
+                    "Browser": result.get("product"),
+                    "Protocol-Version": result.get("protocolVersion"),
+                    "User-Agent": result.get("userAgent"),
+                    "V8-Version": result.get("jsVersion"),
+                    "WebKit-Version": result.get("revision"),
+                    "webSocketDebuggerUrl": self.browser.webSocketDebuggerUrl,
+                }
         resp = await self.get_server("/json/version")
         if resp:
             return await resp.json()
@@ -3218,6 +4281,9 @@ class AsyncChrome(GetValueMixin):
     async def connect(self) -> bool:
         """await self.connect()"""
         self._req = ClientSession()
+        if self.ws_url or self.pipe:
+            # no HTTP discovery for the ws_url / pipe mode
+            return True
         if await self.check_http_ready():
             return True
         else:
@@ -3231,6 +4297,8 @@ class AsyncChrome(GetValueMixin):
 
     async def check(self) -> bool:
         """Test http connection to cdp. `await self.check()`"""
+        if self.ws_url or self.pipe:
+            return await self.check_ws_ready()
         return bool(await self.check_http_ready()) and (await self.check_ws_ready())
 
     async def check_http_ready(self):
@@ -3257,6 +4325,9 @@ class AsyncChrome(GetValueMixin):
 
     async def get_server(self, api: str = "", method="GET") -> Optional[ClientResponse]:
         # maybe return failure request
+        if self.pipe:
+            # no HTTP endpoints for the pipe mode
+            return None
         url = urljoin(self.server, api)
         try:
             resp = await self.req.request(method=method, url=url, timeout=self.timeout)
@@ -3265,9 +4336,34 @@ class AsyncChrome(GetValueMixin):
             self.status = repr(e)
             return None
 
+    def _target_to_tab(self, target_info: dict) -> AsyncTab:
+        return AsyncTab(
+            tab_id=target_info["targetId"],
+            title=target_info.get("title"),
+            url=target_info.get("url"),
+            type=target_info.get("type"),
+            chrome=self,
+            json=target_info,
+        )
+
     async def get_tabs(self, filt_page_type: bool = True) -> List[AsyncTab]:
         """`await self.get_tabs()`.
-        cdp url: /json"""
+        cdp url: /json, or the in-memory TargetRegistry (newest first) if enabled, or Target.getTargets if self.use_cdp"""
+        if self.targets is not None and self.connected:
+            return [
+                self._target_to_tab(target_info)
+                for target_info in self.targets.get_targets(
+                    "page" if filt_page_type is True else None
+                )
+            ]
+        if self.use_cdp:
+            result = await self._send_cdp("Target.getTargets")
+            if result:
+                return [
+                    self._target_to_tab(target_info)
+                    for target_info in result.get("targetInfos", [])
+                    if (target_info["type"] == "page" or filt_page_type is not True)
+                ]
         try:
             r = await self.get_server("/json")
             if r:
@@ -3285,6 +4381,10 @@ class AsyncChrome(GetValueMixin):
         """`await self.get_tab(1)` <=> await `(await self.get_tabs())[1]`
         If not exist, return None
         cdp url: /json"""
+        if self.targets is not None and self.connected and isinstance(index, str):
+            target_info = self.targets.get(index)
+            if target_info:
+                return self._target_to_tab(target_info)
         tabs = await self.get_tabs()
         try:
             if isinstance(index, int):
@@ -3306,6 +4406,11 @@ class AsyncChrome(GetValueMixin):
     async def kill(
         self, timeout: Union[int, float, None] = None, max_deaths: int = 1
     ) -> None:
+        if self.pipe:
+            # no port to find the process, close the browser with the pipe
+            if self.use_cdp:
+                await self._send_cdp("Browser.close")
+            return await self.close()
         if self.req:
             await self.req.close()
         await async_run(
@@ -3313,6 +4418,17 @@ class AsyncChrome(GetValueMixin):
         )
 
     async def new_tab(self, url: str = "") -> Union[AsyncTab, None]:
+        "PUT /json/new, or Target.createTarget if self.use_cdp"
+        if self.use_cdp:
+            result = await self._send_cdp(
+                "Target.createTarget", url=url or "about:blank"
+            )
+            if result and result.get("targetId"):
+                tab = AsyncTab(
+                    tab_id=result["targetId"], url=url, type="page", chrome=self
+                )
+                logger.debug(f"[new_tab] {tab} {result}")
+                return tab
         api = f"/json/new?{quote_plus(url)}"
         r = await self.get_server(api, method="PUT")
         if r:
@@ -3327,9 +4443,19 @@ class AsyncChrome(GetValueMixin):
     async def do_tab(
         self, tab_id: Union[AsyncTab, str], action: str
     ) -> Union[str, bool]:
+        "/json/{action}/{tab_id}, or Target.closeTarget / Target.activateTarget if self.use_cdp"
         ok = False
         if isinstance(tab_id, AsyncTab):
             tab_id = tab_id.tab_id
+        if self.use_cdp and action in {"close", "activate"}:
+            method = {"close": "Target.closeTarget", "activate": "Target.activateTarget"}[
+                action
+            ]
+            result = await self._send_cdp(method, targetId=tab_id)
+            if result is not None:
+                ok = result.get("success", True)
+                logger.debug(f"[{action}_tab] <Tab: {tab_id}>: {ok}")
+                return ok
         r = await self.get_server(f"/json/{action}/{tab_id}")
         if r:
             if action == "close":
@@ -3509,6 +4635,9 @@ class WaitContext(object):
 
 class EventBuffer(asyncio.Queue):
     _SINGLETON_EVENT_KEY = True
+    # drop_newest / drop_oldest / sample / block, the block policy should be opt-in
+    _DEFAULT_OVERFLOW = "drop_newest"
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest", "sample")
 
     def __init__(
         self,
@@ -3519,6 +4648,8 @@ class EventBuffer(asyncio.Queue):
         kwargs: Any = None,
         callback: Callable = None,
         context_callbacks: List[Callable] = None,
+        overflow: str = None,
+        sample_every: int = 1,
     ):
         """Event buffer with callback function.
 
@@ -3530,6 +4661,13 @@ class EventBuffer(asyncio.Queue):
             kwargs (Any, optional): some kwargs saved by self. Defaults to None.
             callback (Callable, optional): default callback function for each event. Defaults to None.
             context_callbacks (List[Callable], optional): callback functions [before_startup, after_startup, before_shutdown, after_shutdown]. Defaults to None.
+            overflow (str, optional): policy while the buffer is full. Defaults to EventBuffer._DEFAULT_OVERFLOW (drop_newest).
+                drop_newest: drop the new event.
+                drop_oldest: drop the oldest event in the buffer.
+                sample: only keep one of every `sample_every` events, and drop the new event while full.
+                block: opt-in, keep all the events, the _recv_daemon stops reading the ws while the buffer is full.
+                    the other tabs sharing the ws are paused too, so the consumer must not wait for any response of the same ws while full, or it deadlocks until timeout.
+            sample_every (int, optional): keep one event every N events for the `sample` policy. Defaults to 1.
 
         """
         self.event_callbacks: Dict[str, Callable] = {}
@@ -3549,8 +4687,73 @@ class EventBuffer(asyncio.Queue):
         else:
             self.context_callbacks = context_callbacks
         self._shutdown = False
+        self.overflow = overflow or self._DEFAULT_OVERFLOW
+        if self.overflow not in self.OVERFLOW_POLICIES:
+            raise ChromeValueError(
+                f"overflow should be one of {self.OVERFLOW_POLICIES}, not {self.overflow}"
+            )
+        self.sample_every = max(1, sample_every)
+        # counters
+        self.received = 0
+        self.dropped = 0
+        self.high_water_mark = 0
+        # the put of the block policy which the _recv_daemon is waiting for
+        self._putter: Optional[Future] = None
         super().__init__(maxsize=maxsize)
 
+    def feed(self, event: dict) -> bool:
+        """Deliver the event from the _recv_daemon without creating a task for each one.
+        Return False if the event is dropped by the overflow policy."""
+        self.received += 1
+        if self.overflow == "sample" and self.received % self.sample_every:
+            self.dropped += 1
+            return False
+        if self.full():
+            if self.overflow == "drop_oldest":
+                self.get_nowait()
+                self.dropped += 1
+                self.put_nowait(event)
+            else:
+                # the block policy should use feed_wait, can not wait here
+                self.dropped += 1
+                return False
+        else:
+            self.put_nowait(event)
+        if self.qsize() > self.high_water_mark:
+            self.high_water_mark = self.qsize()
+        return True
+
+    async def feed_wait(self, event: dict) -> bool:
+        """Deliver the event for the block policy, wait until the buffer is not full.
+        Return False if the buffer exited before the event is put."""
+        self.received += 1
+        self._putter = asyncio.ensure_future(self.put(event))
+        try:
+            # not raise CancelledError if the putter is cancelled by __aexit__
+            await asyncio.wait({self._putter})
+        finally:
+            putter, self._putter = self._putter, None
+            if not putter.done():
+                putter.cancel()
+        if putter.cancelled():
+            self.dropped += 1
+            return False
+        if self.qsize() > self.high_water_mark:
+            self.high_water_mark = self.qsize()
+        return True
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "overflow": self.overflow,
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "blocked": bool(self._putter),
+            "received": self.received,
+            "dropped": self.dropped,
+            "high_water_mark": self.high_water_mark,
+        }
+
     def get_timeout(self) -> float:
         if self.timeout:
             return self.start_time + self.timeout - time.time()
@@ -3571,7 +4774,8 @@ class EventBuffer(asyncio.Queue):
                     if asyncio.iscoroutinefunction(func):
                         result = await func(event=event, tab=self.tab, buffer=self)
                     else:
-                        result = await async_run(
+                        # the user callbacks run in the default executor
+                        result = await to_thread(
                             func, dict(event=event, tab=self.tab, buffer=self)
                         )
                     return result
@@ -3596,6 +4800,9 @@ class EventBuffer(asyncio.Queue):
         await self.run_context_callback(2)
         for event_name in self.events:
             self.tab._buffers.pop(event_name, None)
+        if self._putter and not self._putter.done():
+            # release the _recv_daemon waiting for the buffer
+            self._putter.cancel()
         await self.run_context_callback(3)
 
     def __await__(self):
@@ -3606,6 +4813,10 @@ class EventBuffer(asyncio.Queue):
 
     def shutdown(self):
         if not self._shutdown:
+            if self.full():
+                # make room for the stop signal
+                self.get_nowait()
+                self.dropped += 1
             self.put_nowait(None)
             self._shutdown = True
 
@@ -3629,7 +4840,7 @@ class EventBuffer(asyncio.Queue):
                         if asyncio.iscoroutinefunction(callback):
                             result = await callback(**kwargs)
                         else:
-                            result = await async_run(callback, **kwargs)
+                            result = await to_thread(callback, **kwargs)
                         return result
                     else:
                         return event
@@ -3649,6 +4860,9 @@ class EventBuffer(asyncio.Queue):
 class FetchBuffer(EventBuffer):
     """Enter and activate Fetch.enable, exit with Fetch.disable. Ensure only one FetchBuffer instance at the same moment.
     https://chromedevtools.github.io/devtools-protocol/tot/Fetch/
+
+    Note: the paused requests dropped by the overflow policy will hang until Fetch.disable.
+    The block policy is not allowed, because the consumer needs to send Fetch.continueRequest over the same ws.
     """
 
     def __init__(
@@ -3662,7 +4876,13 @@ class FetchBuffer(EventBuffer):
         kwargs: Any = None,
         callback: Callable = None,
         context_callbacks: List[Callable] = None,
+        overflow: str = None,
+        sample_every: int = 1,
     ):
+        if (overflow or self._DEFAULT_OVERFLOW) == "block":
+            raise ChromeValueError(
+                "FetchBuffer does not support the block overflow policy"
+            )
         self.patterns = patterns or [{"urlPattern": "*"}]
         self.handleAuthRequests = handleAuthRequests
         if not events:
@@ -3678,6 +4898,8 @@ class FetchBuffer(EventBuffer):
             kwargs=kwargs,
             callback=callback,
             context_callbacks=context_callbacks,
+            overflow=overflow,
+            sample_every=sample_every,
         )
 
     async def __aenter__(self):
@@ -3710,6 +4932,33 @@ class FetchBuffer(EventBuffer):
             return data["params"]["requestId"]
         raise TypeError
 
+    async def take_response_body_stream(
+        self, requestId: Union[str, dict], size: int = None, timeout=NotSet
+    ) -> AsyncIterator[bytes]:
+        """[Fetch.takeResponseBodyAsStream] yield the response body chunk by chunk.
+
+        The request should be paused at the Response stage, and it can not be continued as is after this,
+        use fulfillRequest or failRequest instead."""
+        data = await self.tab.send(
+            "Fetch.takeResponseBodyAsStream",
+            requestId=self.ensure_request_id(requestId),
+            timeout=timeout,
+        )
+        handle = self.tab.get_data_value(data, "result.stream")
+        if not handle:
+            raise ChromeRuntimeError(f"Fetch.takeResponseBodyAsStream failed: {data}")
+        async for chunk in self.tab.iter_io_stream(handle, size=size, timeout=timeout):
+            yield chunk
+
+    async def take_response_body(
+        self, requestId: Union[str, dict], save_path=None, size: int = None, timeout=NotSet
+    ) -> Union[bytes, int]:
+        """[Fetch.takeResponseBodyAsStream] return the body bytes; or write to the save_path chunk by chunk and return the file size."""
+        return await self.tab._consume_stream(
+            self.take_response_body_stream(requestId, size=size, timeout=timeout),
+            save_path,
+        )
+
     async def get_response(self, event: dict, timeout=None):
         networkId = self.tab.get_data_value(event, "params.networkId")
         if networkId:
@@ -3923,7 +5172,10 @@ class BrowserContext:
     async def __aexit__(self, *_):
         if self.browserContextId:
             try:
-                await self.browser.send("Target.disposeBrowserContext")
+                await self.browser.send(
+                    "Target.disposeBrowserContext",
+                    browserContextId=self.browserContextId,
+                )
             except Exception:
                 pass
             self.browserContextId = None
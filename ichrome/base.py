@@ -3,17 +3,33 @@
 Base utils and configs for ichrome
 """
 
+import json as _json
+import os
 import re
+import signal
+import socket
+import threading
 import time
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from functools import partial
 from inspect import isawaitable
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 import psutil
 from morebuiltins.utils import read_size
 
 from .logs import logger
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 NotSet = ...
 INF = float("inf")
 CHROME_PROCESS_NAMES = {"chrome.exe", "chrome", "msedge.exe"}
@@ -79,6 +95,367 @@ class Tag:
         return self.__str__()
 
 
+class JSONCodec:
+    """JSON loads / dumps for the CDP messages, using the fastest installed backend.
+
+    backend: orjson / msgspec / json, default to None for the first installed one.
+
+    Demo::
+
+        # reset the global codec
+        AsyncTab._DEFAULT_CODEC = JSONCodec("json")
+        # or for the given AsyncChrome / AsyncTab
+        async with AsyncChrome(codec=JSONCodec("orjson")) as chrome:
+            pass
+    """
+
+    BACKENDS = ("orjson", "msgspec", "json")
+
+    def __init__(self, backend: str = None):
+        if backend is None:
+            for name in self.BACKENDS:
+                try:
+                    self._init_backend(name)
+                    break
+                except ImportError:
+                    continue
+        elif backend in self.BACKENDS:
+            self._init_backend(backend)
+        else:
+            raise ValueError(f"backend should be one of {self.BACKENDS}, not {backend}")
+
+    def _init_backend(self, name):
+        # errors raised by loads / dumps
+        self.errors: tuple = (TypeError, ValueError)
+        if name == "orjson":
+            import orjson
+
+            _option = orjson.OPT_NON_STR_KEYS
+            _sorted_option = _option | orjson.OPT_SORT_KEYS
+
+            def dumps(obj, sort_keys=False) -> str:
+                return orjson.dumps(
+                    obj, option=_sorted_option if sort_keys else _option
+                ).decode("utf-8")
+
+            self.loads = orjson.loads
+            self.dumps = dumps
+        elif name == "msgspec":
+            import msgspec
+
+            _decoder = msgspec.json.Decoder()
+            _encoder = msgspec.json.Encoder()
+
+            def dumps(obj, sort_keys=False) -> str:
+                if sort_keys:
+                    return _json.dumps(obj, sort_keys=True)
+                return _encoder.encode(obj).decode("utf-8")
+
+            self.loads = _decoder.decode
+            self.dumps = dumps
+            self.errors += (msgspec.MsgspecError,)
+        else:
+
+            def dumps(obj, sort_keys=False) -> str:
+                return _json.dumps(obj, sort_keys=sort_keys)
+
+            self.loads = _json.loads
+            self.dumps = dumps
+        self.backend = name
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.backend})"
+
+
+class PortRegistry:
+    """Allocate the free ports across the processes without the TCP probing, with a registry file {port: pid} protected by a file lock.
+
+    - acquire: the first port not registered by the alive processes and can be bound, registered to current pid.
+    - reserve: register the given port to current pid, unless it is registered by another alive process.
+    - release: remove the port registered by current pid, such as after shutdown.
+    The ports of the dead pids are reclaimed while acquiring.
+
+    Demo::
+
+        registry = PortRegistry()
+        port = registry.acquire(start=9222)
+        registry.release(port)
+    """
+
+    DEFAULT_PATH = (
+        Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache")
+        / "ichrome"
+        / "ports.json"
+    )
+
+    def __init__(self, path=None):
+        self.path = Path(path or self.DEFAULT_PATH)
+        self.lock_path = self.path.with_name(f"{self.path.name}.lock")
+
+    @contextmanager
+    def _locked(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a+b") as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load(self) -> Dict[int, int]:
+        try:
+            data = _json.loads(self.path.read_text(encoding="utf-8"))
+            ports = {int(port): int(pid) for port, pid in data.items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            return {}
+        # reclaim the ports of the dead processes
+        return {
+            port: pid
+            for port, pid in ports.items()
+            if pid == os.getpid() or psutil.pid_exists(pid)
+        }
+
+    def _save(self, ports: Dict[int, int]):
+        temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        temp_path.write_text(_json.dumps(ports), encoding="utf-8")
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def can_bind(host: str, port: int) -> bool:
+        "whether the port is not listened by others, without waiting for the connect timeout"
+        sock = socket.socket()
+        try:
+            sock.bind((host, port))
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def acquire(self, host="127.0.0.1", start=9222, max_tries=100) -> Optional[int]:
+        "register and return a free port, or None if all the ports are used"
+        with self._locked():
+            ports = self._load()
+            for port in range(start, start + max_tries):
+                if port in ports:
+                    continue
+                if self.can_bind(host, port):
+                    ports[port] = os.getpid()
+                    self._save(ports)
+                    return port
+            self._save(ports)
+        return None
+
+    def reserve(self, port: int, force=False) -> bool:
+        "register the given port to current pid, return False if it is registered by another alive process and not force"
+        with self._locked():
+            ports = self._load()
+            owner = ports.get(port)
+            if owner is not None and owner != os.getpid() and not force:
+                logger.warning(f"port {port} is registered by the alive pid {owner}")
+                return False
+            ports[port] = os.getpid()
+            self._save(ports)
+            return True
+
+    def release(self, port: int) -> bool:
+        "remove the port registered by current pid"
+        with self._locked():
+            ports = self._load()
+            if ports.get(port) != os.getpid():
+                return False
+            ports.pop(port)
+            self._save(ports)
+            return True
+
+    def get_ports(self) -> Dict[int, int]:
+        "the registered {port: pid} of the alive processes"
+        with self._locked():
+            return self._load()
+
+
+class ProcessTree:
+    """Track the process tree rooted at the launched chrome pid, to avoid scanning the cmdline of all the processes.
+
+    The children are discovered from /proc/<pid>/task/<tid>/children on Linux (psutil children for others),
+    refreshed at most once per `refresh_interval` seconds, and cached as psutil.Process objects,
+    so the children reparented after the root died can still be killed.
+
+    Demo::
+
+        tree = ProcessTree(proc.pid)
+        print(tree.get_memory("rss"))
+        tree.kill()
+    """
+
+    REFRESH_INTERVAL = 1
+    PROC_CHILDREN_PATH = "/proc/%s/task"
+
+    def __init__(self, pid: int, refresh_interval: float = None):
+        self.pid = pid
+        self.refresh_interval = (
+            self.REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+        )
+        try:
+            self.root: Optional[psutil.Process] = psutil.Process(pid)
+        except psutil.Error:
+            self.root = None
+        # the process group of the root started with start_new_session=True, killed together with the tree
+        self.pgid = self.get_own_pgid(pid)
+        self._children: Dict[int, psutil.Process] = {}
+        self._last_refresh = 0.0
+
+    @staticmethod
+    def get_own_pgid(pid: int) -> Optional[int]:
+        "the pgid if the pid is the process group leader, to avoid killing the group of the caller"
+        if not hasattr(os, "getpgid"):
+            return None
+        try:
+            pgid = os.getpgid(pid)
+        except OSError:
+            return None
+        return pgid if pgid == pid else None
+
+    @classmethod
+    def get_child_pids(cls, pid: int) -> Optional[List[int]]:
+        "direct children pids from procfs, None if not supported"
+        task_dir = cls.PROC_CHILDREN_PATH % pid
+        try:
+            pids = []
+            for tid in os.listdir(task_dir):
+                with open(f"{task_dir}/{tid}/children", "rb") as f:
+                    pids.extend(map(int, f.read().split()))
+            return pids
+        except FileNotFoundError:
+            if os.path.isdir(task_dir):
+                # the kernel without CONFIG_PROC_CHILDREN
+                return None
+            return []
+        except (OSError, ValueError):
+            return None
+
+    def _iter_descendants(self):
+        pids = [self.pid]
+        while pids:
+            child_pids = self.get_child_pids(pids.pop())
+            if child_pids is None:
+                # fallback to psutil
+                for proc in self.root.children(recursive=True):
+                    yield proc.pid
+                return
+            for pid in child_pids:
+                yield pid
+                pids.append(pid)
+
+    def refresh(self, force=False):
+        "discover the new children, and forget the dead ones"
+        now = time.time()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+        children = {}
+        if self.is_running():
+            try:
+                for pid in self._iter_descendants():
+                    proc = self._children.get(pid)
+                    if proc is None or not proc.is_running():
+                        proc = psutil.Process(pid)
+                    children[pid] = proc
+            except psutil.Error:
+                # the process tree is changing, try again next time
+                self._last_refresh = 0.0
+        # keep the cached orphans
+        for pid, proc in self._children.items():
+            if pid not in children and proc.is_running():
+                children[pid] = proc
+        self._children = children
+
+    def is_running(self) -> bool:
+        return bool(self.root and self.root.is_running())
+
+    def get_procs(self, refresh=True) -> List[psutil.Process]:
+        "the root and all the children still running"
+        if refresh:
+            self.refresh()
+        procs = [self.root] if self.is_running() else []
+        procs.extend(proc for proc in self._children.values() if proc.is_running())
+        return procs
+
+    def get_memory(self, attr="uss", unit="MB"):
+        return get_memory_by_procs(self.get_procs(), attr=attr, unit=unit)
+
+    def kill(self, timeout: float = 1, grace: float = 0) -> List[psutil.Process]:
+        """kill the process group and the tree, SIGTERM first if grace > 0.
+        return the procs still alive after timeout"""
+        self.refresh(force=True)
+        procs = self.get_procs(refresh=False)
+        pgids = [self.pgid] if self.pgid and procs else []
+        self._children.clear()
+        return kill_procs(procs, grace=grace, timeout=timeout, pgids=pgids)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.pid}, children={len(self._children)})"
+
+
+def wait_procs_gone(procs: List[psutil.Process], timeout: float = 1, interval=0.02):
+    """wait for the procs to exit, return the alive ones after timeout.
+    the zombies are treated as gone, their parents may be killed and the init process reaps them later."""
+    deadline = time.time() + timeout
+    alive = procs
+    while alive:
+        _, alive = psutil.wait_procs(alive, timeout=interval)
+        still_alive = []
+        for proc in alive:
+            try:
+                if proc.status() != psutil.STATUS_ZOMBIE:
+                    still_alive.append(proc)
+            except psutil.Error:
+                continue
+        alive = still_alive
+        if time.time() > deadline:
+            break
+    return alive
+
+
+def _signal_procs(procs: List[psutil.Process], pgids, terminate=False):
+    if pgids and hasattr(os, "killpg"):
+        sig = signal.SIGTERM if terminate else signal.SIGKILL
+        for pgid in pgids:
+            try:
+                os.killpg(pgid, sig)
+            except OSError:
+                pass
+    for proc in procs:
+        try:
+            if terminate:
+                proc.terminate()
+            else:
+                proc.kill()
+        except psutil.Error:
+            continue
+
+
+def kill_procs(
+    procs: List[psutil.Process], grace: float = 0, timeout: float = 1, pgids=()
+) -> List[psutil.Process]:
+    """kill the procs together and wait for them concurrently, return the procs still alive after timeout.
+    grace: send SIGTERM and wait for `grace` seconds before SIGKILL, 0 for SIGKILL directly.
+    pgids: the process groups to be signaled, for the members not in procs."""
+    if grace:
+        _signal_procs(procs, pgids, terminate=True)
+        procs = wait_procs_gone(procs, timeout=grace)
+    _signal_procs(procs, pgids)
+    return wait_procs_gone(procs, timeout=timeout)
+
+
 def get_proc_by_regex(regex, proc_names=None, host_regex=None):
     "find the procs with given proc_names and host_regex"
     proc_names = proc_names or CHROME_PROCESS_NAMES
@@ -121,6 +498,21 @@ def get_memory_by_port(port=9222, attr="uss", unit="MB", host=None, proc_names=N
         return 0
 
 
+def get_memory_by_procs(procs: List[psutil.Process], attr="uss", unit="MB"):
+    "get memory usage of the given procs, skip the dead ones."
+    u = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+    result = 0
+    for proc in procs:
+        try:
+            if attr == "uss":
+                result += proc.memory_full_info().uss
+            else:
+                result += getattr(proc.memory_info(), attr)
+        except psutil.Error:
+            continue
+    return result / u.get(unit, 1)
+
+
 def clear_chrome_process(
     port=None, timeout=None, max_deaths=1, interval=0.5, host=None, proc_names=None
 ):
@@ -134,18 +526,14 @@ def clear_chrome_process(
         timeout = max_deaths or 2
     while 1:
         procs = get_proc(port, host=host, proc_names=proc_names)
-        for proc in procs:
-            try:
-                logger.debug(
-                    f"[Killing] {proc}, port: {port}. {' '.join(proc.cmdline())}"
-                )
-                proc.kill()
-                try:
-                    proc.wait(timeout)
-                except psutil.TimeoutExpired:
-                    pass
-            except (psutil.NoSuchProcess, ProcessLookupError):
-                continue
+        if procs:
+            pgids = []
+            for proc in procs:
+                logger.debug(f"[Killing] {proc}, port: {port}.")
+                pgid = ProcessTree.get_own_pgid(proc.pid)
+                if pgid:
+                    pgids.append(pgid)
+            kill_procs(procs, timeout=timeout, pgids=pgids)
         if port:
             if procs:
                 killed_count += 1
@@ -192,9 +580,6 @@ def get_readable_dir_size(path):
 try:
     from asyncio import to_thread
 except ImportError:
-    from asyncio import get_running_loop
-    from contextvars import copy_context
-    from functools import partial
 
     async def to_thread(func, *args, **kwargs):
         """copy python3.9"""
@@ -204,7 +589,33 @@ except ImportError:
         return await loop.run_in_executor(None, func_call)
 
 
-async_run = to_thread
+# max threads of the executor for the blocking helpers of ichrome, such as file IO and process management
+ASYNC_RUN_MAX_WORKERS = int(
+    os.getenv("ICHROME_ASYNC_RUN_WORKERS") or min(32, (os.cpu_count() or 1) + 4)
+)
+_async_run_executor: Optional[ThreadPoolExecutor] = None
+_async_run_executor_lock = threading.Lock()
+
+
+def get_async_run_executor() -> ThreadPoolExecutor:
+    "the bounded executor of async_run, separated from the default executor of the loop"
+    global _async_run_executor
+    if _async_run_executor is None:
+        with _async_run_executor_lock:
+            if _async_run_executor is None:
+                _async_run_executor = ThreadPoolExecutor(
+                    ASYNC_RUN_MAX_WORKERS, thread_name_prefix="ichrome"
+                )
+    return _async_run_executor
+
+
+async def async_run(func, *args, **kwargs):
+    """like asyncio.to_thread, but run in the ichrome executor, so the blocking helpers
+    will not starve (or be starved by) the default executor of the user."""
+    loop = get_running_loop()
+    ctx = copy_context()
+    func_call = partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_async_run_executor(), func_call)
 
 
 async def ensure_awaitable(result):
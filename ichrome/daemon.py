@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import atexit
+import json
 import os
 import platform
 import re
+import shutil
 import socket
 import subprocess
 import threading
@@ -12,15 +14,22 @@ from getpass import getuser
 from inspect import isawaitable
 from json import loads as _json_loads
 from pathlib import Path
-from typing import List, Literal, Optional, Set, Tuple, Union
+from typing import Dict, List, Literal, Optional, Set, Tuple, Union
 
-from aiohttp import ClientSession
+from aiohttp import ClientError, ClientSession
 from morebuiltins.request import req
 from morebuiltins.utils import read_time, ttime
 
-from .async_utils import AsyncChrome, BrowserContext, _SingleTabConnectionManagerDaemon
+from .async_utils import (
+    AsyncChrome,
+    BrowserContext,
+    _SingleTabConnectionManager,
+    _SingleTabConnectionManagerDaemon,
+)
 from .base import (
     CHROME_PROCESS_NAMES,
+    PortRegistry,
+    ProcessTree,
     async_run,
     clear_chrome_process,
     ensure_awaitable,
@@ -32,6 +41,7 @@ from .base import (
 )
 from .exceptions import ChromeException, ChromeRuntimeError, ChromeTypeError
 from .logs import logger
+from .utils import PipeWebSocket
 
 
 class ChromeDaemon(object):
@@ -52,6 +62,7 @@ class ChromeDaemon(object):
         timeout,              timeout to connect the remote server, default to 1 for localhost
         debug,                set logger level to DEBUG
         proc_check_interval,  check chrome process alive every interval seconds
+        pipe,                 AsyncChromeDaemon only, --remote-debugging-pipe instead of the port (POSIX), the port is only the name of user_data_dir
 
         on_startup & on_shutdown: function which handled a ChromeDaemon object while startup or shutdown
 
@@ -147,8 +158,27 @@ class ChromeDaemon(object):
         "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
         "/Applications/Microsoft Edge.app/Contents/MacOS/Microsoft Edge",
     ]
+    # on-disk cache of `chrome --version` keyed by the realpath, mtime and inode of the executable file.
+    # default to None for the memory cache only, such as `ChromeDaemon.CHROME_PATH_CACHE = Path("~/.cache/ichrome/chrome_path.json").expanduser()`
+    CHROME_PATH_CACHE: Optional[Path] = None
+    # return the cached version and refresh it in a background thread
+    CHROME_PATH_REVALIDATE = False
+    # {realpath: [[st_mtime_ns, st_ino, st_size], version]}
+    _chrome_versions: Dict[str, list] = {}
+    _chrome_versions_loaded = False
+    _chrome_versions_lock = threading.Lock()
     SYSTEM_ENCODING = os.getenv("SYSTEM_ENCODING") or ""
     LAST_N_LINES_STDOUT = 5
+    # pipe the stderr to find the `DevTools listening on ws://...` line for readiness, instead of waiting for the HEAD polling
+    WATCH_DEVTOOLS_LINE = True
+    DEVTOOLS_LINE_REGEX = re.compile(rb"DevTools listening on (ws://\S+)")
+    # --remote-debugging-pipe instead of the port, only for AsyncChromeDaemon(pipe=True)
+    use_pipe = False
+    # seconds to wait for chrome exiting after SIGTERM before SIGKILL, 0 to SIGKILL directly
+    TERMINATE_GRACE = 1
+    # allocate / reserve the ports with the cross-process registry file, such as `ChromeDaemon.PORT_REGISTRY = PortRegistry()`.
+    # default to None: probe the ports with TCP connect, without the file lock and writing
+    PORT_REGISTRY: Optional[PortRegistry] = None
     # if set USE_PORT_USER_DIR=0, default user_data_dir will not create port dir
     USE_PORT_USER_DIR = os.getenv("USE_PORT_USER_DIR") != "0"
 
@@ -193,6 +223,15 @@ class ChromeDaemon(object):
         self._timeout = timeout
         self.ready = False
         self.proc = None
+        # the process tree rooted at self.proc, for get_memory / kill without scanning all the processes
+        self.proc_tree: Optional[ProcessTree] = None
+        # ws://127.0.0.1:9222/devtools/browser/<id> of the running chrome
+        self.browser_ws_url: Optional[str] = None
+        self.restarts = 0
+        # the port registered to PORT_REGISTRY by this daemon, released while shutdown
+        self._registered_port: Optional[int] = None
+        # the port is allocated by PORT_REGISTRY with bind test, no need to probe it again
+        self._port_acquired = False
         self.host = host
         self.port = port
         self.chrome_path = chrome_path or os.getenv("CHROME_PATH")
@@ -216,6 +255,8 @@ class ChromeDaemon(object):
         self._use_port_dir = False
         self.stdout_stderr = stdout_stderr
         self.opened_files = [None, None]
+        # set by the stderr reader thread while the `DevTools listening on` line found
+        self._devtools_listening = threading.Event()
         self.init()
 
     @classmethod
@@ -258,11 +299,38 @@ class ChromeDaemon(object):
 
     def _init_port(self):
         if self.port is None:
-            self.port = self.get_free_port(host=self.host)
+            self.port = self._get_free_port(host=self.host)
+            if self.PORT_REGISTRY is not None:
+                self._port_acquired = True
+                self._registered_port = self.port
+        elif self.PORT_REGISTRY is not None:
+            if self.PORT_REGISTRY.reserve(self.port):
+                self._registered_port = self.port
+            else:
+                # never kill the chrome of the other process, relocate to a free port
+                port = self._get_free_port(host=self.host, start=self.port + 1)
+                logger.warning(
+                    f"port {self.port} is reserved by another process, use port {port} instead"
+                )
+                self.port = port
+                self._port_acquired = True
+                self._registered_port = port
         self.server = f"http://{self.host}:{self.port}"
 
+    def _release_port(self):
+        port, self._registered_port = self._registered_port, None
+        if port is not None and self.PORT_REGISTRY is not None:
+            try:
+                self.PORT_REGISTRY.release(port)
+            except OSError as error:
+                logger.debug(f"release port {port} failed: {error!r}")
+
     def get_memory(self, attr="uss", unit="MB"):
         """Only support local Daemon. `uss` is slower than `rss` but useful."""
+        if self.proc_tree and self.proc_tree.is_running():
+            return self.proc_tree.get_memory(attr=attr, unit=unit)
+        if self.use_pipe:
+            return 0
         return get_memory_by_port(port=self.port, attr=attr, unit=unit, host=self.host)
 
     @staticmethod
@@ -449,11 +517,14 @@ class ChromeDaemon(object):
 
     @property
     def cmd(self):
-        args = [
-            self.chrome_path,
-            f"--remote-debugging-address={self.host}",
-            f"--remote-debugging-port={self.port}",
-        ]
+        if self.use_pipe:
+            args = [self.chrome_path, "--remote-debugging-pipe"]
+        else:
+            args = [
+                self.chrome_path,
+                f"--remote-debugging-address={self.host}",
+                f"--remote-debugging-port={self.port}",
+            ]
         if self.headless:
             args.append("--headless")
             args.append("--hide-scrollbars")
@@ -557,8 +628,93 @@ class ChromeDaemon(object):
 
     def _start_chrome_process(self):
         self.chrome_proc_start_time = time.time()
-        self.proc = subprocess.Popen(**self.get_cmd_args())
+        self.browser_ws_url = None
+        self._devtools_listening.clear()
+        kwargs = self.get_cmd_args()
+        watching, tee = self._get_stderr_tee(kwargs)
+        if watching:
+            kwargs = dict(kwargs, stderr=subprocess.PIPE)
+        if self.use_pipe:
+            kwargs, chrome_fds = self._get_pipe_cmd_args(kwargs)
+            try:
+                self.proc = subprocess.Popen(**kwargs)
+            finally:
+                for fd in chrome_fds:
+                    os.close(fd)
+        else:
+            self.proc = subprocess.Popen(**kwargs)
         self.LAUNCHED_PIDS.add(self.proc.pid)
+        self.proc_tree = ProcessTree(self.proc.pid)
+        if watching:
+            threading.Thread(
+                target=self._watch_stderr,
+                args=(self.proc.stderr, tee),
+                name=f"ichrome-stderr-{self.port}",
+                daemon=True,
+            ).start()
+
+    def _get_pipe_cmd_args(self, kwargs):
+        """redirect the pipes to the fd 3 / 4 of chrome, and save the parent side as self.pipe_fds (write_fd, read_fd).
+        return the new Popen kwargs and the chrome side fds to be closed after Popen."""
+        if os.name != "posix" or not kwargs.get("shell"):
+            raise ChromeRuntimeError("pipe mode only support the posix shell")
+        # chrome reads from fd 3, writes to fd 4
+        chrome_read, parent_write = os.pipe()
+        parent_read, chrome_write = os.pipe()
+        chrome_fds = (chrome_read, chrome_write)
+        self.pipe_fds = (parent_write, parent_read)
+        # /dev/fd/N instead of `3<&N`, the shell may not support the multi-digit fd
+        args = f"exec {kwargs['args']} 3</dev/fd/{chrome_read} 4>/dev/fd/{chrome_write}"
+        return dict(kwargs, args=args, pass_fds=chrome_fds), chrome_fds
+
+    def _get_stderr_tee(self, kwargs):
+        """return (watching, tee): whether the stderr can be piped, and the file to write the piped lines.
+        The stderr set by the popen_kwargs or inherited from the parent process will not be piped."""
+        if not self.WATCH_DEVTOOLS_LINE or kwargs.get("text"):
+            return False, None
+        if "stderr" in self.popen_kwargs:
+            return False, None
+        stderr = kwargs.get("stderr")
+        if stderr == subprocess.STDOUT:
+            stderr = kwargs.get("stdout")
+        if stderr is None:
+            return False, None
+        if stderr == subprocess.DEVNULL:
+            return True, None
+        return hasattr(stderr, "write"), stderr
+
+    def _watch_stderr(self, pipe, tee=None):
+        "read the stderr lines, tee them to the log file and find the browser ws url"
+        try:
+            for line in iter(pipe.readline, b""):
+                if tee is not None:
+                    try:
+                        tee.write(line)
+                        tee.flush()
+                    except (OSError, ValueError):
+                        # closed by close_stdout_stderr, keep draining the pipe
+                        tee = None
+                if not self._devtools_listening.is_set():
+                    match = self.DEVTOOLS_LINE_REGEX.search(line)
+                    if match:
+                        self.browser_ws_url = self._ensure_ws_url_host(
+                            match.group(1).decode("utf-8", "replace")
+                        )
+                        self._devtools_listening.set()
+                        self._on_devtools_listening()
+        except (OSError, ValueError):
+            pass
+        finally:
+            pipe.close()
+
+    def _on_devtools_listening(self):
+        "called in the stderr reader thread while the `DevTools listening on` line found"
+        pass
+
+    def _ensure_ws_url_host(self, ws_url: str) -> str:
+        "the listening address may be 0.0.0.0, use the host:port of self.server instead"
+        path = ws_url.split("/", 3)[-1]
+        return f"ws://{self.host}:{self.port}/{path}"
 
     def launch_chrome(self):
         self._start_chrome_process()
@@ -567,6 +723,9 @@ class ChromeDaemon(object):
             if not self.proc_ok:
                 error = "launch_chrome failed for proc not ok"
                 break
+            if self._devtools_listening.is_set():
+                self.ready = True
+                break
             try:
                 r = req.head(self.server, timeout=self._timeout)
                 if r.ok:
@@ -574,13 +733,36 @@ class ChromeDaemon(object):
                     break
             except Exception:
                 pass
-            time.sleep(0.5)
+            self._devtools_listening.wait(0.5)
         else:
             error = "launch_chrome failed for connection not ok"
         if error:
             logger.error(error)
             raise ChromeRuntimeError(error)
 
+    def get_browser_ws_url(self) -> Optional[str]:
+        "the browser ws url from the DevTools line, or GET /json/version only while it is not found"
+        if not self.browser_ws_url and not self.use_pipe:
+            try:
+                r = req.get(f"{self.server}/json/version", timeout=self._timeout)
+                self.browser_ws_url = r.json().get("webSocketDebuggerUrl")
+            except Exception as error:
+                logger.debug(f"{self} get browser_ws_url failed: {error!r}")
+        return self.browser_ws_url
+
+    def get_manifest_item(self, rss=None) -> dict:
+        "the info of this daemon for the ChromeWorkers manifest"
+        return {
+            "host": self.host,
+            "port": self.port,
+            "pid": self.proc.pid if self.proc else None,
+            "ws_url": self.browser_ws_url,
+            "start_time": getattr(self, "chrome_proc_start_time", self.start_time),
+            "rss": rss,
+            "restarts": self.restarts,
+            "ready": self.ready,
+        }
+
     def check_chrome_ready(self):
         if self.ok:
             logger.debug(f"launch_chrome success: {self}, args: {self.proc.args}")
@@ -591,10 +773,34 @@ class ChromeDaemon(object):
 
     @classmethod
     def get_free_port(cls, host="127.0.0.1", start=9222, max_tries=100, timeout=1):
-        for offset in range(max_tries):
-            port = start + offset
-            if cls._check_host_port_in_use(host, port, timeout):
+        return cls._get_free_port(
+            host=host, start=start, max_tries=max_tries, timeout=timeout
+        )
+
+    @classmethod
+    def get_worker_ports(cls, amount: int, host="127.0.0.1", start=9222) -> List[int]:
+        "the ports of the workers: consecutive ports from `start`, or the free ports registered to PORT_REGISTRY if it is not None"
+        if cls.PORT_REGISTRY is None:
+            return list(range(start, start + amount))
+        ports = []
+        for _ in range(amount):
+            port = cls._get_free_port(host=host, start=start)
+            ports.append(port)
+            start = port + 1
+        return ports
+
+    @classmethod
+    def _get_free_port(cls, host="127.0.0.1", start=9222, max_tries=100, timeout=1):
+        "find a free port, and register it to PORT_REGISTRY if it is not None"
+        if cls.PORT_REGISTRY is not None:
+            port = cls.PORT_REGISTRY.acquire(host=host, start=start, max_tries=max_tries)
+            if port is not None:
                 return port
+        else:
+            for offset in range(max_tries):
+                port = start + offset
+                if cls._check_host_port_in_use(host, port, timeout):
+                    return port
         raise ChromeRuntimeError(f"No free port beteen {start} and {start + max_tries}")
 
     @staticmethod
@@ -612,6 +818,8 @@ class ChromeDaemon(object):
                 sock.close()
 
     def _ensure_port_free(self, max_tries=3):
+        if self._port_acquired:
+            return True
         for _ in range(max_tries):
             ok = self._check_host_port_in_use(self.host, self.port, self._timeout)
             if ok:
@@ -648,14 +856,74 @@ class ChromeDaemon(object):
                     "unknown platform, could not find the default chrome path."
                 )
             for path in paths:
-                try:
-                    out = subprocess.check_output([path, "--version"], timeout=2)
-                    if not out:
-                        continue
-                    if out.startswith((b"Google Chrome ", b"Microsoft Edge")):
-                        yield path
-                except (FileNotFoundError, subprocess.TimeoutExpired):
-                    continue
+                # skip the missing files without spawning a process
+                path = shutil.which(path)
+                if path and cls.get_chrome_version(path):
+                    yield path
+
+    @classmethod
+    def get_chrome_version(cls, path: str) -> str:
+        """return the output of `chrome --version` like "Google Chrome 120.0.6099.109", or "" for the non-chrome file.
+        Cached in memory (and CHROME_PATH_CACHE if set), until the executable file changed."""
+        realpath = os.path.realpath(path)
+        try:
+            stat = os.stat(realpath)
+        except OSError:
+            return ""
+        key = [stat.st_mtime_ns, stat.st_ino, stat.st_size]
+        with cls._chrome_versions_lock:
+            cls._load_chrome_versions()
+            cached = cls._chrome_versions.get(realpath)
+        if cached and cached[0] == key:
+            if cls.CHROME_PATH_REVALIDATE:
+                threading.Thread(
+                    target=cls._update_chrome_version,
+                    args=(realpath, key),
+                    daemon=True,
+                ).start()
+            return cached[1]
+        return cls._update_chrome_version(realpath, key)
+
+    @classmethod
+    def _update_chrome_version(cls, realpath: str, key: list) -> str:
+        version = ""
+        try:
+            out = subprocess.check_output([realpath, "--version"], timeout=2)
+            if out.startswith((b"Google Chrome ", b"Microsoft Edge")):
+                version = out.decode("utf-8", "replace").strip()
+        except (OSError, subprocess.SubprocessError):
+            pass
+        with cls._chrome_versions_lock:
+            cls._chrome_versions[realpath] = [key, version]
+            cls._save_chrome_versions()
+        return version
+
+    @classmethod
+    def _load_chrome_versions(cls):
+        if cls._chrome_versions_loaded:
+            return
+        cls._chrome_versions_loaded = True
+        if not cls.CHROME_PATH_CACHE:
+            return
+        try:
+            data = json.loads(Path(cls.CHROME_PATH_CACHE).read_text(encoding="utf-8"))
+            if isinstance(data, dict):
+                cls._chrome_versions.update(data)
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def _save_chrome_versions(cls):
+        if not cls.CHROME_PATH_CACHE:
+            return
+        path = Path(cls.CHROME_PATH_CACHE)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            temp_path.write_text(json.dumps(cls._chrome_versions), encoding="utf-8")
+            os.replace(temp_path, path)
+        except OSError as error:
+            logger.debug(f"save {path} failed: {error!r}")
 
     @classmethod
     def _get_default_path(cls):
@@ -719,18 +987,31 @@ class ChromeDaemon(object):
 
     def kill(self, force=False):
         self.ready = False
+        proc_tree, self.proc_tree = self.proc_tree, None
+        if proc_tree:
+            proc_tree.kill(timeout=self._timeout, grace=self.TERMINATE_GRACE)
         if self.proc:
             self.proc.kill()
             self.proc.__exit__(None, None, None)
             self.LAUNCHED_PIDS.discard(self.proc.pid)
+        if self.use_pipe:
+            # the other chrome may be using the same port, only kill the process tree
+            return
+        if proc_tree and self._check_host_port_in_use(
+            self.host, self.port, self._timeout
+        ):
+            # the whole tree is killed, no orphans listening on the port
+            return
         if force:
             max_deaths = self.max_deaths
         else:
             max_deaths = 0
+        # fallback to scan the processes, for the orphans or the chrome not launched by self
         self.clear_chrome_process(self.port, max_deaths=max_deaths, host=self.host)
 
     def restart(self):
         logger.debug(f"restarting {self}")
+        self.restarts += 1
         self.kill()
         return self.launch_chrome()
 
@@ -751,6 +1032,7 @@ class ChromeDaemon(object):
         if self.on_shutdown:
             self.on_shutdown(self)
         self.kill(True)
+        self._release_port()
         self.close_stdout_stderr(error_name=getattr(exc_type, "__name__", ""))
         if self.after_shutdown:
             self.after_shutdown(self)
@@ -802,7 +1084,30 @@ class ChromeDaemon(object):
         return str(self)
 
 
+class _SharedChromeContext:
+    "enter the context created with the shared AsyncChrome of the AsyncChromeDaemon"
+
+    def __init__(self, chrome_daemon: "AsyncChromeDaemon", factory):
+        self.chrome_daemon = chrome_daemon
+        self.factory = factory
+        self.context = None
+
+    async def __aenter__(self):
+        chrome = await self.chrome_daemon.get_chrome()
+        self.context = self.factory(chrome)
+        return await self.context.__aenter__()
+
+    async def __aexit__(self, *args):
+        if self.context:
+            await self.context.__aexit__(*args)
+            self.context = None
+
+
 class AsyncChromeDaemon(ChromeDaemon):
+    # share one AsyncChrome (HTTP session + browser ws) for all the tabs, instead of a new one for each connect_tab / incognito_tab
+    SHARE_CHROME_CONNECTION = True
+    # seconds to poll the chrome process while pidfd is not supported
+    PROC_POLL_INTERVAL = 0.5
     _demo = r'''
 
     demo::
@@ -877,7 +1182,10 @@ class AsyncChromeDaemon(ChromeDaemon):
             Literal["", "/dev/null", "stdout.log"],
             Literal["", "/dev/null", "stderr.log", "stdout.log"],
         ] = ("stdout.log", "stdout.log"),
+        pipe: bool = False,
     ):
+        # CDP over --remote-debugging-pipe, no port will be listened, the port is only used as the name of the user_data_dir
+        self.use_pipe = pipe
         super().__init__(
             chrome_path=chrome_path,
             host=host,
@@ -907,6 +1215,13 @@ class AsyncChromeDaemon(ChromeDaemon):
     def init(self):
         # Please init AsyncChromeDaemon in a running loop with `async with`
         self._chrome = AsyncChrome(self.host, self.port, timeout=self._timeout)
+        self._shared_chrome: Optional[AsyncChrome] = None
+        self._shared_chrome_lock: Optional[asyncio.Lock] = None
+        # the pipe of the running chrome for the pipe mode
+        self.pipe_fds: Optional[Tuple[int, int]] = None
+        self._pipe_ws: Optional[PipeWebSocket] = None
+        self._pipe_restart_lock: Optional[asyncio.Lock] = None
+        self._launching_pipe = False
         self._init_coro = self._init_chrome_daemon()
 
     async def _init_chrome_daemon(self):
@@ -918,7 +1233,8 @@ class AsyncChromeDaemon(ChromeDaemon):
         _chrome_path = Path(self.chrome_path)
         if _chrome_path.is_file():
             CHROME_PROCESS_NAMES.add(_chrome_path.name)
-        await async_run(self._ensure_port_free)
+        if not self.use_pipe:
+            await async_run(self._ensure_port_free)
         if self.before_startup:
             await ensure_awaitable(self.before_startup(self))
         await self.launch_chrome()
@@ -931,28 +1247,162 @@ class AsyncChromeDaemon(ChromeDaemon):
     async def restart(self):
         "restart the chrome process"
         logger.debug(f"restarting {self}")
+        self.restarts += 1
+        await self.close_chrome()
         await async_run(self.kill)
         return await self.launch_chrome()
 
+    async def get_chrome(self) -> AsyncChrome:
+        """Return the long-lived AsyncChrome shared by the tabs of this daemon.
+        It will be reconnected if the HTTP session or browser ws is broken, such as after restart."""
+        chrome = self._shared_chrome
+        if chrome and chrome.connected:
+            return chrome
+        if self._shared_chrome_lock is None:
+            self._shared_chrome_lock = asyncio.Lock()
+        async with self._shared_chrome_lock:
+            chrome = self._shared_chrome
+            if chrome and chrome.connected:
+                return chrome
+            # the pipe can not be reopened, keep it for the new AsyncChrome
+            await self.close_chrome(keep_pipe=self.use_pipe)
+            pipe_ws = self._pipe_ws
+            if self.use_pipe and (not pipe_ws or pipe_ws.closed):
+                chrome = None
+            else:
+                if self.use_pipe:
+                    chrome = AsyncChrome(pipe=pipe_ws, timeout=self._timeout)
+                elif self.browser_ws_url:
+                    # found in the DevTools line, no HEAD + /json/version discovery
+                    chrome = AsyncChrome(
+                        ws_url=self.browser_ws_url, timeout=self._timeout
+                    )
+                else:
+                    chrome = AsyncChrome(
+                        host=self.host, port=self.port, timeout=self._timeout
+                    )
+                try:
+                    await chrome.__aenter__()
+                except (ChromeException, ClientError, asyncio.TimeoutError, OSError) as error:
+                    logger.error(f"{self} connect chrome failed: {error!r}")
+                if not chrome.connected:
+                    await chrome.close(keep_pipe=self.use_pipe)
+                    raise ChromeRuntimeError(f"{self} connect chrome failed.")
+                self._shared_chrome = chrome
+                return chrome
+        # restart out of the _shared_chrome_lock, the launch_chrome will get_chrome again
+        return await self._restart_for_dead_pipe(pipe_ws)
+
+    async def _restart_for_dead_pipe(self, pipe_ws):
+        "the pipe of a running chrome is closed, restart the chrome for a new pipe"
+        if self._pipe_restart_lock is None:
+            self._pipe_restart_lock = asyncio.Lock()
+        async with self._pipe_restart_lock:
+            if self._pipe_ws is not pipe_ws and self._pipe_ws and not self._pipe_ws.closed:
+                # restarted by the others
+                return await self.get_chrome()
+            if self._shutdown or self._launching_pipe or not self._proc_ok():
+                # the dead process is restarted by the daemon with max_deaths
+                raise ChromeRuntimeError(f"{self} pipe is closed.")
+            logger.error(f"{self} restarting for the pipe is closed.")
+            await self.restart()
+            return await self.get_chrome()
+
+    async def close_chrome(self, keep_pipe=False):
+        "close the shared AsyncChrome. keep_pipe: not close the pipe, for reconnecting"
+        chrome, self._shared_chrome = self._shared_chrome, None
+        if chrome:
+            await chrome.close(keep_pipe=keep_pipe)
+
+    async def check_shared_chrome(self) -> bool:
+        "check the local state of the shared AsyncChrome connection without probing, reconnect it if broken"
+        try:
+            await self.get_chrome()
+            return True
+        except ChromeRuntimeError:
+            return False
+
+    @property
+    def share_chrome_connection(self) -> bool:
+        "the pipe can only be used by one AsyncChrome"
+        return self.SHARE_CHROME_CONNECTION or self.use_pipe
+
+    async def _launch_pipe_chrome(self):
+        if self._pipe_ws:
+            await self._pipe_ws.close()
+        await async_run(self._start_chrome_process)
+        self._pipe_ws = await PipeWebSocket(*self.pipe_fds).connect()
+        self.pipe_fds = None
+        self._launching_pipe = True
+        try:
+            chrome = await asyncio.wait_for(
+                self.get_chrome(), timeout=self.MAX_WAIT_CHECKING_SECONDS
+            )
+            self.ready = await chrome.check_ws_ready()
+        except (ChromeRuntimeError, asyncio.TimeoutError):
+            self.ready = False
+        finally:
+            self._launching_pipe = False
+        if not self.ready:
+            await self.close_chrome()
+            error = "launch_chrome failed for pipe not ok"
+            logger.error(error)
+            raise ChromeRuntimeError(error)
+
     async def launch_chrome(self):
         "launch the chrome with remote-debugging mode"
+        if self.use_pipe:
+            return await self._launch_pipe_chrome()
+        # set by the stderr reader thread with call_soon_threadsafe, no executor thread waits for it
+        self._devtools_listening_loop = asyncio.get_running_loop()
+        self._devtools_listening_async = asyncio.Event()
         await async_run(self._start_chrome_process)
         error = None
         for _ in range(int(self.MAX_WAIT_CHECKING_SECONDS * 2)):
             if not await async_run(self._proc_ok):
                 error = "launch_chrome failed for proc not ok"
                 break
-            if await self._check_chrome_connection():
+            if await self._check_chrome_connection(launching=True):
                 self.ready = True
                 break
-            await asyncio.sleep(0.5)
+            try:
+                await asyncio.wait_for(self._devtools_listening_async.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
         else:
             error = "launch_chrome failed for connection not ok"
         if error:
             logger.error(error)
             raise ChromeRuntimeError(error)
 
-    async def _check_chrome_connection(self):
+    def _on_devtools_listening(self):
+        try:
+            self._devtools_listening_loop.call_soon_threadsafe(
+                self._devtools_listening_async.set
+            )
+        except (AttributeError, RuntimeError):
+            # not launched by the async launch_chrome, or the loop is closed
+            pass
+
+    async def get_browser_ws_url(self) -> Optional[str]:
+        "the browser ws url from the DevTools line, or GET /json/version only while it is not found"
+        if not self.browser_ws_url and not self.use_pipe:
+            try:
+                async with ClientSession() as session:
+                    r = await session.get(
+                        f"{self.server}/json/version", timeout=self._timeout
+                    )
+                    self.browser_ws_url = (await r.json()).get("webSocketDebuggerUrl")
+            except Exception as error:
+                logger.debug(f"{self} get browser_ws_url failed: {error!r}")
+        return self.browser_ws_url
+
+    async def _check_chrome_connection(self, launching=False):
+        "HEAD the server, or return True once the DevTools line is found while launching"
+        if self.use_pipe:
+            return await self.check_shared_chrome()
+        if launching and self._devtools_listening.is_set():
+            return True
         async with ClientSession() as session:
             start = time.time()
             for _ in range(20):
@@ -962,7 +1412,16 @@ class AsyncChromeDaemon(ChromeDaemon):
                 except Exception:
                     if time.time() - start > self.MAX_WAIT_CHECKING_SECONDS:
                         break
-                    await asyncio.sleep(0.1)
+                    if launching:
+                        try:
+                            await asyncio.wait_for(
+                                self._devtools_listening_async.wait(), 0.1
+                            )
+                            return True
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await asyncio.sleep(0.1)
             raise ChromeRuntimeError(
                 f"check_chrome_connection failed for {self.server} not ok."
             )
@@ -990,7 +1449,7 @@ class AsyncChromeDaemon(ChromeDaemon):
     ):
         "find a free port which can be used"
         return await async_run(
-            super().get_free_port,
+            cls._get_free_port,
             host=host,
             start=start,
             max_tries=max_tries,
@@ -998,6 +1457,8 @@ class AsyncChromeDaemon(ChromeDaemon):
         )
 
     async def check_ws_ready(self):
+        if self.share_chrome_connection:
+            return await self.check_shared_chrome()
         async with self._chrome as chrome:
             return await chrome.check_ws_ready()
 
@@ -1055,7 +1516,7 @@ class AsyncChromeDaemon(ChromeDaemon):
                 deaths += 1
                 continue
             try:
-                return_code = await async_run(self.proc.wait, interval)
+                return_code = await self._wait_proc(interval)
                 if self._shutdown_reason:
                     break
                 deaths += 1
@@ -1066,6 +1527,47 @@ class AsyncChromeDaemon(ChromeDaemon):
         )
         return return_code
 
+    async def _wait_proc(self, timeout):
+        """wait for the chrome process exiting without holding a thread: a pidfd with loop.add_reader on Linux,
+        or polling the return code every PROC_POLL_INTERVAL seconds. raise subprocess.TimeoutExpired like Popen.wait"""
+        proc = self.proc
+        if proc.poll() is not None:
+            return proc.returncode
+        pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                pidfd = os.pidfd_open(proc.pid)
+            except OSError:
+                pidfd = None
+        if pidfd is not None:
+            loop = asyncio.get_running_loop()
+            exited = loop.create_future()
+            try:
+                loop.add_reader(
+                    pidfd, lambda: exited.done() or exited.set_result(None)
+                )
+            except NotImplementedError:
+                # the loop without add_reader, such as ProactorEventLoop
+                os.close(pidfd)
+                pidfd = None
+            else:
+                try:
+                    await asyncio.wait({exited}, timeout=timeout)
+                finally:
+                    loop.remove_reader(pidfd)
+                    os.close(pidfd)
+                    exited.cancel()
+                if proc.poll() is None:
+                    raise subprocess.TimeoutExpired(proc.args, timeout)
+                return proc.returncode
+        deadline = time.time() + timeout
+        while proc.poll() is None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            await asyncio.sleep(min(self.PROC_POLL_INTERVAL, remaining))
+        return proc.returncode
+
     async def __aenter__(self):
         return await self._init_coro
 
@@ -1094,7 +1596,9 @@ class AsyncChromeDaemon(ChromeDaemon):
             logger.debug(msg)
         if self.on_shutdown:
             await ensure_awaitable(self.on_shutdown(self))
+        await self.close_chrome()
         await async_run(self.kill, True)
+        await async_run(self._release_port)
         await async_run(
             self.close_stdout_stderr,
             error_name=getattr(exc_type, "__name__", ""),
@@ -1130,6 +1634,13 @@ class AsyncChromeDaemon(ChromeDaemon):
             If auto_close is True: close this tab while exiting context.
 
             View more about flatten: https://chromedevtools.github.io/devtools-protocol/tot/Target/#method-attachToTarget"""
+        if self.share_chrome_connection:
+            return _SharedChromeContext(
+                self,
+                lambda chrome: _SingleTabConnectionManager(
+                    chrome=chrome, index=index, auto_close=auto_close, flatten=flatten
+                ),
+            )
         return _SingleTabConnectionManagerDaemon(
             host=self.host,
             port=self.port,
@@ -1156,14 +1667,22 @@ class AsyncChromeDaemon(ChromeDaemon):
         proxyServer: str = None,
         proxyBypassList: str = None,
         originsWithUniversalNetworkAccess: List[str] = None,
-    ) -> BrowserContext:
+    ) -> Union[BrowserContext, _SharedChromeContext]:
         "create a new browser context, which can be set new proxy, same like the incognito mode"
-        return BrowserContext(
-            chrome=AsyncChrome(host=self.host, port=self.port, timeout=self._timeout),
-            disposeOnDetach=disposeOnDetach,
-            proxyServer=proxyServer,
-            proxyBypassList=proxyBypassList,
-            originsWithUniversalNetworkAccess=originsWithUniversalNetworkAccess,
+
+        def factory(chrome: AsyncChrome):
+            return BrowserContext(
+                chrome=chrome,
+                disposeOnDetach=disposeOnDetach,
+                proxyServer=proxyServer,
+                proxyBypassList=proxyBypassList,
+                originsWithUniversalNetworkAccess=originsWithUniversalNetworkAccess,
+            )
+
+        if self.share_chrome_connection:
+            return _SharedChromeContext(self, factory)
+        return factory(
+            AsyncChrome(host=self.host, port=self.port, timeout=self._timeout)
         )
 
     def incognito_tab(
@@ -1181,19 +1700,26 @@ class AsyncChromeDaemon(ChromeDaemon):
         flatten: bool = None,
     ):
         "create a new tab with incognito mode, this is really a good choice"
-        chrome = AsyncChrome(host=self.host, port=self.port, timeout=self._timeout)
-        return chrome.incognito_tab(
-            url=url,
-            width=width,
-            height=height,
-            enableBeginFrameControl=enableBeginFrameControl,
-            newWindow=newWindow,
-            background=background,
-            flatten=flatten,
-            disposeOnDetach=disposeOnDetach,
-            proxyServer=proxyServer,
-            proxyBypassList=proxyBypassList,
-            originsWithUniversalNetworkAccess=originsWithUniversalNetworkAccess,
+
+        def factory(chrome: AsyncChrome):
+            return chrome.incognito_tab(
+                url=url,
+                width=width,
+                height=height,
+                enableBeginFrameControl=enableBeginFrameControl,
+                newWindow=newWindow,
+                background=background,
+                flatten=flatten,
+                disposeOnDetach=disposeOnDetach,
+                proxyServer=proxyServer,
+                proxyBypassList=proxyBypassList,
+                originsWithUniversalNetworkAccess=originsWithUniversalNetworkAccess,
+            )
+
+        if self.share_chrome_connection:
+            return _SharedChromeContext(self, factory)
+        return factory(
+            AsyncChrome(host=self.host, port=self.port, timeout=self._timeout)
         )
 
     def __del__(self):
@@ -1201,12 +1727,32 @@ class AsyncChromeDaemon(ChromeDaemon):
 
 
 class ChromeWorkers:
-    def __init__(self, start_port=9222, workers=1, kwargs=None):
+    """Launch `workers` AsyncChromeDaemons on the ports from `start_port`.
+
+    manifest_path: write the JSON manifest of the browsers atomically, so the clients can attach them without probing.
+        `AsyncChrome.from_manifest(manifest_path, port=9222)`
+    manifest_interval: refresh the rss of the manifest every N seconds, the other changes (restart) are written in 1 second.
+    """
+
+    # check the changes of the daemons every N seconds
+    _MANIFEST_CHECK_INTERVAL = 1
+
+    def __init__(
+        self,
+        start_port=9222,
+        workers=1,
+        kwargs=None,
+        manifest_path=None,
+        manifest_interval=10,
+    ):
         self.start_port = start_port or 9222
         self.workers = workers or 1
         self.kwargs = kwargs or {}
         self.daemons: List[AsyncChromeDaemon] = []
         self.tasks = []
+        self.manifest_path = Path(manifest_path) if manifest_path else None
+        self.manifest_interval = manifest_interval
+        self._manifest_task = None
 
     async def __aenter__(self):
         return await self.create_chrome_workers()
@@ -1216,13 +1762,77 @@ class ChromeWorkers:
             await cd._daemon_thread
 
     async def create_chrome_workers(self):
-        for port in range(self.start_port, self.start_port + self.workers):
+        ports = await async_run(
+            AsyncChromeDaemon.get_worker_ports,
+            self.workers,
+            host=self.kwargs.get("host", "127.0.0.1"),
+            start=self.start_port,
+        )
+        for port in ports:
             logger.debug("ChromeDaemon cmd args: port=%s, %s" % (port, self.kwargs))
             cd = AsyncChromeDaemon(port=port, **self.kwargs)
             self.daemons.append(cd)
             self.tasks.append(asyncio.ensure_future(self.start_daemon(cd)))
+        if self.manifest_path:
+            self._manifest_task = asyncio.ensure_future(self._manifest_daemon())
         return self
 
+    def get_manifest(self, rss: dict = None) -> dict:
+        rss = rss or {}
+        return {
+            "updated_at": time.time(),
+            "browsers": [
+                daemon.get_manifest_item(rss=rss.get(daemon.port))
+                for daemon in self.daemons
+            ],
+        }
+
+    def write_manifest(self, manifest: dict):
+        "write to a temp file and replace the manifest_path, the readers never see a partial file"
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.manifest_path.with_name(
+            f".{self.manifest_path.name}.{os.getpid()}.tmp"
+        )
+        temp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(temp_path, self.manifest_path)
+
+    async def _manifest_daemon(self):
+        last_signature = None
+        rss: dict = {}
+        next_rss_time = 0.0
+        while True:
+            now = time.time()
+            if now >= next_rss_time:
+                next_rss_time = now + self.manifest_interval
+                for daemon in self.daemons:
+                    if daemon.ready:
+                        rss[daemon.port] = round(
+                            await async_run(daemon.get_memory, "rss"), 1
+                        )
+                force = True
+            else:
+                force = False
+            for daemon in self.daemons:
+                if daemon.ready and not daemon.browser_ws_url:
+                    # only the manifest needs it while the DevTools line is not found
+                    await daemon.get_browser_ws_url()
+            signature = [
+                (
+                    daemon.port,
+                    daemon.proc and daemon.proc.pid,
+                    daemon.browser_ws_url,
+                    daemon.restarts,
+                )
+                for daemon in self.daemons
+            ]
+            if force or signature != last_signature:
+                last_signature = signature
+                try:
+                    await async_run(self.write_manifest, self.get_manifest(rss))
+                except OSError as error:
+                    logger.error(f"{self} write manifest failed: {error!r}")
+            await asyncio.sleep(self._MANIFEST_CHECK_INTERVAL)
+
     async def wait(self):
         for task in self.tasks:
             try:
@@ -1231,12 +1841,24 @@ class ChromeWorkers:
                 pass
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._manifest_task:
+            self._manifest_task.cancel()
         for daemon in self.daemons:
             await daemon.shutdown("__aexit__", exc_type=exc_type)
+        if self.manifest_path:
+            await async_run(self.manifest_path.unlink, True)
 
     @classmethod
-    async def run_chrome_workers(cls, start_port, workers, kwargs):
-        async with cls(start_port, workers, kwargs) as cd:
+    async def run_chrome_workers(
+        cls, start_port, workers, kwargs, manifest_path=None, manifest_interval=10
+    ):
+        async with cls(
+            start_port,
+            workers,
+            kwargs,
+            manifest_path=manifest_path,
+            manifest_interval=manifest_interval,
+        ) as cd:
             await cd.wait()
 
 
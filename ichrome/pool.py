@@ -3,10 +3,11 @@ import random
 import time
 import typing
 from base64 import b64decode
+from collections import deque
 from copy import deepcopy
 
 from . import AsyncChromeDaemon, AsyncTab
-from .base import ensure_awaitable
+from .base import async_run, ensure_awaitable
 from .exceptions import ChromeException
 from .logs import logger
 
@@ -128,6 +129,27 @@ class ChromeWorker:
     RESTART_EVERY = 8 * 60
     # --disk-cache-size default cache size 100MB
     DEFAULT_CACHE_SIZE = 100 * 1024**2
+    # keep N (incognito context, attached blank tab) ready for the default incognito tasks, 0 for disable
+    PREWARM_TABS = 0
+    # reuse N idle browser contexts for the incognito tasks with the same proxy settings, 0 for disable.
+    # the cookies and the storage of the origins tracked by AsyncTab.track_origins are cleared between the tasks,
+    # a best effort not as isolated as a new context: the HTTP cache and the untracked origins (navigated inside an OOPIF) survive
+    CONTEXT_POOL_SIZE = 0
+    # retire the pooled browser context after N tasks or N seconds
+    CONTEXT_MAX_USES = 50
+    CONTEXT_MAX_AGE = 5 * 60
+    # the incognito_args to create the pooled browser context, others are used for the new tab
+    CONTEXT_POOL_KEYS = (
+        "proxyServer",
+        "proxyBypassList",
+        "originsWithUniversalNetworkAccess",
+    )
+    # keep N idle tabs reset by AsyncTab.reset_state for the next task, instead of a new tab for each task, 0 for disable.
+    # only the tasks with the default incognito args are recycled, each tab owns a browser context
+    RECYCLE_TABS = 0
+    # close the recycled tab after N tasks, or the Performance.getMetrics values over the thresholds
+    TAB_MAX_USES = 100
+    TAB_METRICS_THRESHOLDS = {"Nodes": 50000, "JSHeapUsedSize": 200 * 1024**2}
 
     def __init__(
         self,
@@ -136,6 +158,9 @@ class ChromeWorker:
         q: asyncio.PriorityQueue = None,
         restart_every: typing.Union[float, int] = None,
         flatten=None,
+        prewarm_tabs: int = None,
+        context_pool_size: int = None,
+        recycle_tabs: int = None,
         **daemon_kwargs,
     ):
         assert q, "queue should not be null"
@@ -159,6 +184,18 @@ class ChromeWorker:
         self.consumers: typing.List[asyncio.Task] = []
         self._running_futures: typing.Set[int] = set()
         self._daemon_start_time = time.time()
+        self.prewarm_tabs = self.PREWARM_TABS if prewarm_tabs is None else prewarm_tabs
+        # (daemon_start_time, context, tab)
+        self._prewarmed: typing.Deque[tuple] = deque()
+        self._prewarm_task = None
+        self.context_pool_size = (
+            self.CONTEXT_POOL_SIZE if context_pool_size is None else context_pool_size
+        )
+        # {key: [_PooledContext]} of the idle browser contexts
+        self._context_pool: typing.Dict[tuple, typing.List[_PooledContext]] = {}
+        self.recycle_tabs = self.RECYCLE_TABS if recycle_tabs is None else recycle_tabs
+        # the idle recycled tabs
+        self._recycled_tabs: typing.Deque[_RecycledTab] = deque()
 
     @property
     def todos(self):
@@ -180,12 +217,256 @@ class ChromeWorker:
         self._chrome_daemon_ready = asyncio.Event()
         self._need_restart = asyncio.Event()
         self.daemon_task = self.start_tab_worker()
+        self._prewarm_needed = asyncio.Event()
         self.consumers = [
             asyncio.create_task(self.future_consumer(_))
             for _ in range(self.max_concurrent_tabs)
         ]
+        if self.prewarm_tabs > 0:
+            self._prewarm_task = asyncio.create_task(self._prewarm_daemon())
         return self.daemon_task
 
+    async def _prewarm_daemon(self):
+        "keep self.prewarm_tabs incognito tabs ready, refill them after they are taken"
+        while not self._shutdown:
+            await self._chrome_daemon_ready.wait()
+            if len(self._prewarmed) >= self.prewarm_tabs:
+                self._prewarm_needed.clear()
+                await self._prewarm_needed.wait()
+                continue
+            chrome_daemon = self.chrome_daemon
+            daemon_start_time = self._daemon_start_time
+            context = chrome_daemon.incognito_tab()
+            try:
+                tab = await context.__aenter__()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.error(f"{self} prewarm tab failed: {error!r}")
+                await asyncio.sleep(1)
+                continue
+            if (
+                self._shutdown
+                or daemon_start_time != self._daemon_start_time
+                or not self._chrome_daemon_ready.is_set()
+            ):
+                await self._dispose_prewarmed(context)
+                continue
+            self._prewarmed.append((daemon_start_time, context, tab))
+
+    def _pop_prewarmed(self):
+        "pop a prewarmed (context, tab) of the running chrome daemon, or (None, None)"
+        while self._prewarmed:
+            daemon_start_time, context, tab = self._prewarmed.popleft()
+            self._prewarm_needed.set()
+            if (
+                daemon_start_time == self._daemon_start_time
+                and tab.status == "connected"
+            ):
+                return context, tab
+            asyncio.ensure_future(self._dispose_prewarmed(context))
+        return None, None
+
+    async def _dispose_prewarmed(self, context):
+        try:
+            await asyncio.wait_for(context.__aexit__(None, None, None), timeout=3)
+        except (asyncio.TimeoutError, Exception):
+            pass
+
+    async def clear_prewarmed(self):
+        "dispose all the prewarmed tabs, such as before restart"
+        while self._prewarmed:
+            _, context, _ = self._prewarmed.popleft()
+            await self._dispose_prewarmed(context)
+        self._prewarm_needed.set()
+
+    def get_context_key(self, incognito_args: dict) -> tuple:
+        key = []
+        for name in self.CONTEXT_POOL_KEYS:
+            value = incognito_args.get(name)
+            if isinstance(value, list):
+                value = tuple(value)
+            key.append(value)
+        return tuple(key)
+
+    async def _acquire_context(self, key: tuple) -> "_PooledContext":
+        "get an idle browser context from the pool, or create a new one"
+        idles = self._context_pool.get(key)
+        while idles:
+            pooled = idles.pop()
+            if pooled.is_alive(self._daemon_start_time):
+                return pooled
+            await pooled.dispose()
+        context = self.chrome_daemon.create_context(
+            disposeOnDetach=False,
+            **{
+                name: (list(value) if isinstance(value, tuple) else value)
+                for name, value in zip(self.CONTEXT_POOL_KEYS, key)
+            },
+        )
+        return _PooledContext(
+            context,
+            await context.__aenter__(),
+            self._daemon_start_time,
+            max_uses=self.CONTEXT_MAX_USES,
+            max_age=self.CONTEXT_MAX_AGE,
+        )
+
+    async def _release_context(self, key: tuple, pooled: "_PooledContext"):
+        "put the browser context back to the pool, or dispose it if retired / pool is full"
+        pooled.uses += 1
+        idle_count = sum((len(idles) for idles in self._context_pool.values()))
+        if (
+            not self._shutdown
+            and idle_count < self.context_pool_size
+            and pooled.is_alive(self._daemon_start_time)
+            and await pooled.clear_cookies()
+        ):
+            self._context_pool.setdefault(key, []).append(pooled)
+        else:
+            await pooled.dispose()
+
+    async def clear_context_pool(self):
+        "dispose all the idle pooled browser contexts, such as before restart"
+        pool, self._context_pool = self._context_pool, {}
+        for idles in pool.values():
+            for pooled in idles:
+                await pooled.dispose()
+
+    async def handle_pooled_context_future(self, future):
+        "run the incognito task in a pooled browser context with the same proxy settings"
+        key = self.get_context_key(future.incognito_args)
+        try:
+            pooled = await self._acquire_context(key)
+        except Exception as error:
+            logger.error(f"{self} create browser context failed: {error!r}")
+            self.set_need_restart()
+            if future.port:
+                return await self.port_queue.put(future)
+            return await self.q.put(future)
+        tab_kwargs = {
+            name: value
+            for name, value in future.incognito_args.items()
+            if name in _PooledContext.TAB_KWARGS
+        }
+        try:
+            async with pooled.browser_context.new_tab(
+                auto_close=True, **tab_kwargs
+            ) as tab:
+                try:
+                    if not await tab.track_origins(timeout=2):
+                        # can not clear the storage of the untracked origins
+                        pooled.retired = True
+                    if isinstance(future.data, _TabWorker):
+                        await self.handle_tab_worker_future(tab, future)
+                    else:
+                        await self.handle_default_future(tab, future)
+                finally:
+                    if not await pooled.clear_tab_storage(tab):
+                        pooled.retired = True
+        except Exception:
+            pooled.retired = True
+            raise
+        finally:
+            await self._release_context(key, pooled)
+
+    def is_recyclable(self, future: "ChromeTask") -> bool:
+        """the tasks with the default incognito args.
+        The tabs of the normal mode share the default browser context and the profile,
+        clearing their storage would break the concurrent tasks, so they are never recycled."""
+        return future.incognito_args == {}
+
+    async def _acquire_recycled_tab(self) -> "_RecycledTab":
+        "get an idle recycled tab, or create a new one"
+        idles = self._recycled_tabs
+        while idles:
+            recycled = idles.popleft()
+            if recycled.is_alive(self._daemon_start_time):
+                return recycled
+            await recycled.close()
+        # one browser context for each recycled tab, the concurrent tasks never share the cookies / storage
+        context = self.chrome_daemon.create_context(disposeOnDetach=False)
+        pooled = _PooledContext(
+            context,
+            await context.__aenter__(),
+            self._daemon_start_time,
+            max_uses=self.CONTEXT_MAX_USES,
+            max_age=self.CONTEXT_MAX_AGE,
+        )
+        connection = pooled.browser_context.new_tab(
+            auto_close=True, flatten=self._flatten
+        )
+        recycled = _RecycledTab(connection, None, self._daemon_start_time, pooled)
+        try:
+            recycled.tab = await connection.__aenter__()
+            # reset_state clears the storage of all the origins touched by the task
+            recycled.tracked = await recycled.tab.track_origins(timeout=2)
+        except BaseException:
+            await recycled.close()
+            raise
+        return recycled
+
+    async def _check_tab_metrics(self, tab: AsyncTab) -> bool:
+        "whether the DOM / heap counters of the tab are under TAB_METRICS_THRESHOLDS"
+        if not self.TAB_METRICS_THRESHOLDS:
+            return True
+        metrics = await tab.get_performance_metrics(timeout=2)
+        if not metrics:
+            return False
+        for name, threshold in self.TAB_METRICS_THRESHOLDS.items():
+            if metrics.get(name, 0) > threshold:
+                logger.info(f"{self} close the recycled tab for {name}={metrics[name]}")
+                return False
+        return True
+
+    async def _release_recycled_tab(self, recycled: "_RecycledTab"):
+        "reset the tab and put it back for the next task, or close it"
+        recycled.uses += 1
+        recycled.pooled.uses += 1
+        idles = self._recycled_tabs
+        try:
+            ok = (
+                not self._shutdown
+                and len(idles) < self.recycle_tabs
+                and recycled.uses < self.TAB_MAX_USES
+                and recycled.tracked
+                and recycled.is_alive(self._daemon_start_time)
+                and await self._check_tab_metrics(recycled.tab)
+                and await recycled.tab.reset_state(timeout=3)
+                and await recycled.pooled.clear_cookies()
+            )
+        except (ChromeException, asyncio.TimeoutError) as error:
+            logger.error(f"{self} reset the recycled tab failed: {error!r}")
+            ok = False
+        if ok:
+            idles.append(recycled)
+        else:
+            await recycled.close()
+
+    async def clear_recycled_tabs(self):
+        "close all the idle recycled tabs and their browser context, such as before restart"
+        recycled_tabs, self._recycled_tabs = self._recycled_tabs, deque()
+        for recycled in recycled_tabs:
+            await recycled.close()
+
+    async def handle_recycled_tab_future(self, future):
+        "run the task in a recycled tab"
+        try:
+            recycled = await self._acquire_recycled_tab()
+        except Exception as error:
+            logger.error(f"{self} create the recycled tab failed: {error!r}")
+            self.set_need_restart()
+            if future.port:
+                return await self.port_queue.put(future)
+            return await self.q.put(future)
+        try:
+            if isinstance(future.data, _TabWorker):
+                await self.handle_tab_worker_future(recycled.tab, future)
+            else:
+                await self.handle_default_future(recycled.tab, future)
+        finally:
+            await self._release_recycled_tab(recycled)
+
     async def _start_chrome_daemon(self):
         while not self._shutdown:
             self._chrome_daemon_ready.clear()
@@ -199,6 +480,8 @@ class ChromeWorker:
             ) as chrome_daemon:
                 self._daemon_start_time = time.time()
                 self.chrome_daemon = chrome_daemon
+                # the daemon relocates the port reserved by another process
+                self.port = chrome_daemon.port
                 for _ in range(10):
                     if await chrome_daemon.connection_ok:
                         self._chrome_daemon_ready.set()
@@ -218,6 +501,9 @@ class ChromeWorker:
                         msg = f"restarting for interval {self._restart_interval}. ({self})"
                         logger.info(msg)
                         break
+                await self.clear_prewarmed()
+                await self.clear_context_pool()
+                await self.clear_recycled_tabs()
                 logger.info(f"[offline] {self} is offline.")
 
     async def future_consumer(self, index=None):
@@ -249,8 +535,33 @@ class ChromeWorker:
                 # overdue task, skip
                 continue
             await self._chrome_daemon_ready.wait()
-            if await self.chrome_daemon._check_chrome_connection():
-                if isinstance(future.incognito_args, dict):
+            if self.chrome_daemon.share_chrome_connection:
+                # the shared AsyncChrome is checked without new HTTP requests
+                ok = await self.chrome_daemon.check_shared_chrome()
+            else:
+                ok = await self.chrome_daemon._check_chrome_connection()
+            if ok:
+                if self.recycle_tabs > 0 and self.is_recyclable(future):
+                    await self.handle_recycled_tab_future(future)
+                    continue
+                if future.incognito_args == {} and self._prewarmed:
+                    # the default incognito args, use the prewarmed tab
+                    context, tab = self._pop_prewarmed()
+                else:
+                    context = tab = None
+                if tab:
+                    try:
+                        if isinstance(future.data, _TabWorker):
+                            await self.handle_tab_worker_future(tab, future)
+                        else:
+                            await self.handle_default_future(tab, future)
+                    finally:
+                        await self._dispose_prewarmed(context)
+                elif self.context_pool_size > 0 and isinstance(
+                    future.incognito_args, dict
+                ):
+                    await self.handle_pooled_context_future(future)
+                elif isinstance(future.incognito_args, dict):
                     # incognito mode
                     async with self.chrome_daemon.incognito_tab(
                         **future.incognito_args
@@ -329,6 +640,9 @@ class ChromeWorker:
             return
         self._shutdown = True
         self._need_restart.set()
+        if self._prewarm_task:
+            self._prewarm_task.cancel()
+            self._prewarm_needed.set()
         await self.daemon_task
         for task in self.consumers:
             task.cancel()
@@ -344,6 +658,119 @@ class ChromeWorker:
         return str(self)
 
 
+class _PooledContext:
+    "a reusable BrowserContext of ChromeWorker, retired after max_uses tasks or max_age seconds"
+
+    TAB_KWARGS = {
+        "url",
+        "width",
+        "height",
+        "enableBeginFrameControl",
+        "newWindow",
+        "background",
+        "flatten",
+    }
+
+    def __init__(
+        self, context, browser_context, daemon_start_time, max_uses=50, max_age=300
+    ):
+        # _SharedChromeContext or BrowserContext
+        self.context = context
+        self.browser_context = browser_context
+        self.daemon_start_time = daemon_start_time
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.created_at = time.time()
+        self.uses = 0
+        self.retired = False
+
+    def is_alive(self, daemon_start_time) -> bool:
+        return not (
+            self.retired
+            or self.daemon_start_time != daemon_start_time
+            or not self.browser_context.browserContextId
+            or self.uses >= self.max_uses
+            or time.time() - self.created_at >= self.max_age
+        )
+
+    async def clear_tab_storage(self, tab: AsyncTab) -> bool:
+        """clear the storage of all the origins touched by the tab (tracked by AsyncTab.track_origins) before it is closed.
+        Return False if any origin failed, then the context should be retired."""
+        try:
+            origins = set(tab._touched_origins)
+            origin = await tab.get_variable("window.location.origin", timeout=2)
+            if isinstance(origin, str):
+                origins.add(tab.get_origin(origin))
+            origins.discard("")
+            if not origins:
+                return True
+            results = await tab.send_many(
+                [
+                    (
+                        "Storage.clearDataForOrigin",
+                        {"origin": origin, "storageTypes": "all"},
+                    )
+                    for origin in origins
+                ],
+                timeout=2,
+                auto_enable=False,
+            )
+            tab._touched_origins.clear()
+            return all((result and "result" in result for result in results))
+        except (ChromeException, asyncio.TimeoutError):
+            return False
+
+    async def clear_cookies(self) -> bool:
+        "clear the cookies of all the domains in this browser context"
+        try:
+            data = await self.browser_context.browser.send(
+                "Storage.clearCookies",
+                browserContextId=self.browser_context.browserContextId,
+                timeout=2,
+            )
+            return bool(data and "result" in data)
+        except (ChromeException, asyncio.TimeoutError):
+            return False
+
+    async def dispose(self):
+        self.retired = True
+        try:
+            await asyncio.wait_for(self.context.__aexit__(None, None, None), timeout=3)
+        except (asyncio.TimeoutError, Exception):
+            pass
+
+
+class _RecycledTab:
+    "a long-lived tab of ChromeWorker, reset by AsyncTab.reset_state between the tasks"
+
+    def __init__(self, connection, tab: AsyncTab, daemon_start_time, pooled):
+        self.connection = connection
+        self.tab = tab
+        self.daemon_start_time = daemon_start_time
+        # _PooledContext owned by the tab, retired with CONTEXT_MAX_USES / CONTEXT_MAX_AGE
+        self.pooled: _PooledContext = pooled
+        self.uses = 0
+        # the origins touched by the task are tracked by AsyncTab.track_origins
+        self.tracked = False
+
+    def is_alive(self, daemon_start_time) -> bool:
+        return (
+            self.daemon_start_time == daemon_start_time
+            and self.tab.status == "connected"
+            and self.pooled.is_alive(daemon_start_time)
+        )
+
+    async def close(self):
+        if self.tab is not None:
+            try:
+                await asyncio.wait_for(
+                    self.connection.__aexit__(None, None, None), timeout=3
+                )
+            except (asyncio.TimeoutError, Exception):
+                pass
+        await self.pooled.dispose()
+
+
 class ChromeEngine:
     START_PORT = 9345
     DEFAULT_WORKERS_AMOUNT = 1
@@ -352,12 +779,21 @@ class ChromeEngine:
     FLATTEN = True
     # Use incognico mode by default, or you can se ChromeEngine.DEFAULT_INCOGNITO_ARGS = None to use normal mode
     DEFAULT_INCOGNITO_ARGS: dict = {}
+    # prewarmed incognito tabs of each worker, for the tasks with DEFAULT_INCOGNITO_ARGS
+    PREWARM_TABS = 0
+    # idle browser contexts of each worker reused by the incognito tasks with the same proxy, 0 for disable
+    CONTEXT_POOL_SIZE = 0
+    # idle tabs of each worker reused by the tasks after reset, 0 for disable
+    RECYCLE_TABS = 0
 
     def __init__(
         self,
         workers_amount: int = None,
         max_concurrent_tabs=None,
         start_port: int = None,
+        prewarm_tabs: int = None,
+        context_pool_size: int = None,
+        recycle_tabs: int = None,
         **daemon_kwargs,
     ):
         self._q: typing.Union[asyncio.PriorityQueue, asyncio.Queue] = None
@@ -367,6 +803,11 @@ class ChromeEngine:
         self.workers_amount = workers_amount or self.DEFAULT_WORKERS_AMOUNT
         self.max_concurrent_tabs = max_concurrent_tabs
         self.start_port = daemon_kwargs.pop("port", start_port) or self.START_PORT
+        self.prewarm_tabs = self.PREWARM_TABS if prewarm_tabs is None else prewarm_tabs
+        self.context_pool_size = (
+            self.CONTEXT_POOL_SIZE if context_pool_size is None else context_pool_size
+        )
+        self.recycle_tabs = self.RECYCLE_TABS if recycle_tabs is None else recycle_tabs
         self.daemon_kwargs = daemon_kwargs
 
     @property
@@ -379,21 +820,32 @@ class ChromeEngine:
             self._q = asyncio.PriorityQueue()
         return self._q
 
-    def _add_default_workers(self):
-        for offset in range(self.workers_amount):
-            port = self.start_port + offset
+    def _add_default_workers(self, ports: typing.List[int] = None):
+        if ports is None:
+            ports = range(self.start_port, self.start_port + self.workers_amount)
+        for port in ports:
             worker = ChromeWorker(
                 port=port,
                 max_concurrent_tabs=self.max_concurrent_tabs,
                 q=self.q,
                 flatten=self.FLATTEN,
+                prewarm_tabs=self.prewarm_tabs,
+                context_pool_size=self.context_pool_size,
+                recycle_tabs=self.recycle_tabs,
                 **self.daemon_kwargs,
             )
             self.workers[port] = worker
 
     async def start_workers(self):
         if not self.workers:
-            self._add_default_workers()
+            # allocate the ports through AsyncChromeDaemon.PORT_REGISTRY if it is enabled
+            ports = await async_run(
+                AsyncChromeDaemon.get_worker_ports,
+                self.workers_amount,
+                host=self.daemon_kwargs.get("host", "127.0.0.1"),
+                start=self.start_port,
+            )
+            self._add_default_workers(ports)
         for worker in self.workers.values():
             worker.start_daemon()
         return self
@@ -488,6 +940,8 @@ class ChromeEngine:
             fromSurface=fromSurface,
             save_path=save_path,
             captureBeyondViewport=bool(captureBeyondViewport),
+            # decode the image bytes from the raw frame
+            raw=not as_base64,
         )
         image = await self.do(
             data=data,
@@ -495,10 +949,10 @@ class ChromeEngine:
             timeout=timeout,
             tab_index=None,
         )
-        if as_base64 or not image:
-            return image
-        else:
+        if isinstance(image, str) and not as_base64:
             return b64decode(image)
+        # the bytes decoded from the raw frame
+        return image
 
     async def download(
         self,
@@ -590,15 +1044,24 @@ class CommonUtils:
     async def download(self, tab: AsyncTab, data, timeout):
         start_time = time.time()
         result = {"url": data["url"]}
+        # pipeline the setup commands, instead of one roundtrip for each
+        commands: list = []
         cookies = data.get("cookies") or {}
         for name, value in cookies.items():
-            await tab.set_cookie(name=name, value=value, url=data["url"])
+            commands.append(
+                (
+                    "Network.setCookie",
+                    {"name": name, "value": value, "url": data["url"]},
+                )
+            )
         user_agent = data.get("user_agent")
         if user_agent:
-            await tab.set_ua(user_agent)
+            commands.append(("Network.setUserAgentOverride", {"userAgent": user_agent}))
         extra_headers = data.get("extra_headers")
         if extra_headers:
-            await tab.set_headers(extra_headers)
+            commands.append(("Network.setExtraHTTPHeaders", {"headers": extra_headers}))
+        if commands:
+            await tab.send_many(commands, timeout=timeout)
         await tab.set_url(data["url"], timeout=timeout)
         if data["wait_tag"]:
             timeout = timeout - (time.time() - start_time)
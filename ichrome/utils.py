@@ -1,4 +1,7 @@
 import asyncio
+import os
+
+from aiohttp.http import WSMsgType
 
 
 class ForwardedConnection(asyncio.Protocol):
@@ -65,3 +68,85 @@ class PortForwarder(asyncio.Protocol):
     def connection_lost(self, e):
         if self.fc.transport:
             self.fc.transport.close()
+
+
+class _PipeMessage:
+    __slots__ = ("type", "data")
+
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+
+
+class PipeWebSocket:
+    """The transport of `chrome --remote-debugging-pipe`, with the same interface of aiohttp ClientWebSocketResponse used by AsyncTab: send_str / close / closed / `async for msg in ws`.
+
+    The messages are the JSON strings terminated by NUL, chrome reads them from fd 3 and writes to fd 4.
+
+    write_fd: the parent side of the chrome fd 3.
+    read_fd: the parent side of the chrome fd 4.
+    """
+
+    # max size of one message, the screenshot / printToPDF may be very large
+    READ_LIMIT = 2**30
+    SEPARATOR = b"\0"
+
+    def __init__(self, write_fd: int, read_fd: int):
+        self.write_file = os.fdopen(write_fd, "wb", buffering=0)
+        self.read_file = os.fdopen(read_fd, "rb", buffering=0)
+        self._reader: asyncio.StreamReader = None
+        self._read_transport: asyncio.ReadTransport = None
+        self._writer: asyncio.StreamWriter = None
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def connect(self) -> "PipeWebSocket":
+        loop = asyncio.get_running_loop()
+        self._reader = asyncio.StreamReader(limit=self.READ_LIMIT)
+        self._read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self._reader), self.read_file
+        )
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, self.write_file
+        )
+        self._writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        return self
+
+    async def send_str(self, data: str):
+        if self._closed or self._writer is None:
+            raise ConnectionResetError(f"{self} is closed")
+        self._writer.write(data.encode("utf-8") + self.SEPARATOR)
+        await self._writer.drain()
+
+    def __aiter__(self):
+        return self._iter_messages()
+
+    async def _iter_messages(self):
+        while not self._closed:
+            try:
+                data = await self._reader.readuntil(self.SEPARATOR)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # chrome exited
+                break
+            yield _PipeMessage(WSMsgType.TEXT, data[:-1].decode("utf-8"))
+        await self.close()
+
+    async def close(self) -> bool:
+        if self._closed:
+            return False
+        self._closed = True
+        if self._writer:
+            self._writer.close()
+        else:
+            self.write_file.close()
+        if self._read_transport:
+            self._read_transport.close()
+        else:
+            self.read_file.close()
+        return True
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(closed={self._closed})"
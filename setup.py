@@ -32,7 +32,7 @@ setup(
     author="ClericPy",
     author_email="clericpy@gmail.com",
     url="https://github.com/ClericPy/ichrome",
-    extras_require={"web": ["uvicorn", "fastapi"]},
+    extras_require={"web": ["uvicorn", "fastapi"], "speedups": ["orjson"]},
     packages=find_packages(),
     platforms="any",
     classifiers=[